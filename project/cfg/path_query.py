@@ -1,37 +1,79 @@
 import networkx as nx
+import numpy as np
 
+from collections import deque
 from pyformlang.cfg import CFG
+from typing import Hashable, Iterator
 from pyformlang.rsa import RecursiveAutomaton
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, identity
 
+from project.graph_index import GraphIndex, as_graph_automaton
 from project.cfg.normal_forms import cfg_to_weak_normal_form
 from project.cfg.rsm import rsm_to_nfa
-from project.regular.to_automaton import graph_to_nfa
-from project.regular.automatons import AdjacencyMatrixFA, intersect_automata
+from project.regular.path_query import count_pairs
+from project.regular.product import ProductIndex
+from project.regular.automatons import (
+    AdjacencyMatrixFA,
+    LazyIntersectionFA,
+    intersect_automata,
+)
 
 
-def hellings_based_cfpq(
+def _iter_answer_pairs(
+    graph_automaton: AdjacencyMatrixFA, matrix: csr_matrix
+) -> Iterator[tuple[int, int]]:
+    u, v = matrix.nonzero()
+    answer = graph_automaton.start_mask[u] & graph_automaton.final_mask[v]
+
+    graph_state_names = graph_automaton.state_names
+    for u_idx, v_idx in zip(u[answer], v[answer]):
+        yield graph_state_names[u_idx], graph_state_names[v_idx]
+
+
+def _iter_new_answer_pairs(
+    graph_automaton: AdjacencyMatrixFA, matrix: csr_matrix, found: csr_matrix
+) -> tuple[csr_matrix, Iterator[tuple[int, int]]]:
+    new_answers = csr_matrix(matrix > found)
+    return found + new_answers, _iter_answer_pairs(graph_automaton, new_answers)
+
+
+def _iter_start_symbol_pairs(
+    cfg: CFG, graph_automaton: AdjacencyMatrixFA, triples: set
+) -> Iterator[tuple[int, int]]:
+    graph_state_names = graph_automaton.state_names
+    for sym, v, u in triples:
+        if (
+            sym == cfg.start_symbol
+            and graph_automaton.start_mask[v]
+            and graph_automaton.final_mask[u]
+        ):
+            yield graph_state_names[v], graph_state_names[u]
+
+
+def iter_hellings_based_cfpq(
     cfg: CFG,
-    graph: nx.DiGraph,
+    graph: nx.DiGraph | GraphIndex,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
-) -> set[tuple[int, int]]:
-    graph_nodes = set(graph.nodes)
-    start_nodes = start_nodes if start_nodes else graph_nodes
-    final_nodes = final_nodes if final_nodes else graph_nodes
-
+) -> Iterator[tuple[int, int]]:
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
     cfg = cfg_to_weak_normal_form(cfg)
 
-    r = set((N, v, v) for v in graph_nodes for N in cfg.get_nullable_symbols())
+    r = set(
+        (N, v, v)
+        for v in range(graph_automaton.number_of_states)
+        for N in cfg.get_nullable_symbols()
+    )
 
-    for v, u, label in graph.edges.data("label"):
-        for prod in cfg.productions:
-            if (
-                len(prod.body) == 1
-                and prod.body[0] in cfg.terminals
-                and prod.body[0].value == label
-            ):
-                r.add((prod.head, v, u))
+    for prod in cfg.productions:
+        if len(prod.body) == 1 and prod.body[0] in cfg.terminals:
+            adj_matrix = graph_automaton.matrix(prod.body[0].value)
+            if adj_matrix is None:
+                continue
+            for v, u in zip(*adj_matrix.nonzero()):
+                r.add((prod.head, int(v), int(u)))
+
+    yield from _iter_start_symbol_pairs(cfg, graph_automaton, r)
 
     while True:
         new_triples = set()
@@ -51,44 +93,45 @@ def hellings_based_cfpq(
         if not new_triples:
             break
         r = r.union(new_triples)
-
-    return set(
-        (v, u)
-        for sym, v, u in r
-        if sym == cfg.start_symbol and v in start_nodes and u in final_nodes
-    )
+        yield from _iter_start_symbol_pairs(cfg, graph_automaton, new_triples)
 
 
-def matrix_based_cfpq(
+def hellings_based_cfpq(
     cfg: CFG,
-    graph: nx.DiGraph,
+    graph: nx.DiGraph | GraphIndex,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
 ) -> set[tuple[int, int]]:
-    graph_nodes = set(graph.nodes)
-    start_nodes = start_nodes if start_nodes else graph_nodes
-    final_nodes = final_nodes if final_nodes else graph_nodes
+    return set(iter_hellings_based_cfpq(cfg, graph, start_nodes, final_nodes))
 
-    node_to_idx_mapping = {node: i for i, node in enumerate(graph_nodes)}
-    idx_to_node_mapping = {i: node for i, node in enumerate(graph_nodes)}
 
-    n = len(graph_nodes)
+def _iter_new_pairs_of_results(
+    graph_automaton: AdjacencyMatrixFA, results: Iterator[csr_matrix]
+) -> Iterator[tuple[int, int]]:
+    n = graph_automaton.number_of_states
+    found = csr_matrix((n, n), dtype=bool)
+    for matrix in results:
+        found, new_pairs = _iter_new_answer_pairs(graph_automaton, matrix, found)
+        yield from new_pairs
+
+
+def _iter_matrix_based_results(
+    cfg: CFG, graph_automaton: AdjacencyMatrixFA
+) -> Iterator[csr_matrix]:
+    n = graph_automaton.number_of_states
     cfg = cfg_to_weak_normal_form(cfg)
     decomposition = {var: csr_matrix((n, n), dtype=bool) for var in cfg.variables}
 
-    for u, v, label in graph.edges.data("label"):
-        for prod in cfg.productions:
-            if (
-                len(prod.body) == 1
-                and prod.body[0] in cfg.terminals
-                and prod.body[0].value == label
-            ):
-                decomposition[prod.head][
-                    node_to_idx_mapping[u], node_to_idx_mapping[v]
-                ] = True
+    for prod in cfg.productions:
+        if len(prod.body) == 1 and prod.body[0] in cfg.terminals:
+            adj_matrix = graph_automaton.matrix(prod.body[0].value)
+            if adj_matrix is not None:
+                decomposition[prod.head] = decomposition[prod.head] + adj_matrix
 
     for N in cfg.get_nullable_symbols():
-        decomposition[N].setdiag(True)
+        decomposition[N] = decomposition[N] + identity(n, dtype=bool, format="csr")
+
+    yield decomposition[cfg.start_symbol]
 
     changed = True
     while changed:
@@ -102,63 +145,151 @@ def matrix_based_cfpq(
             if (decomposition[A_i] != head_matrix).nnz != 0:
                 changed = True
                 decomposition[A_i] = head_matrix
+                if A_i == cfg.start_symbol:
+                    yield head_matrix
 
-    return {
-        (idx_to_node_mapping[u], idx_to_node_mapping[v])
-        for u, v in zip(*decomposition[cfg.start_symbol].nonzero())
-        if idx_to_node_mapping[u] in start_nodes
-        and idx_to_node_mapping[v] in final_nodes
-    }
 
+def iter_matrix_based_cfpq(
+    cfg: CFG,
+    graph: nx.DiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+) -> Iterator[tuple[int, int]]:
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    yield from _iter_new_pairs_of_results(
+        graph_automaton, _iter_matrix_based_results(cfg, graph_automaton)
+    )
 
-def tensor_based_cfpq(
-    rsm: RecursiveAutomaton,
-    graph: nx.DiGraph,
+
+def matrix_based_cfpq(
+    cfg: CFG,
+    graph: nx.DiGraph | GraphIndex,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
 ) -> set[tuple[int, int]]:
+    return set(iter_matrix_based_cfpq(cfg, graph, start_nodes, final_nodes))
+
+
+def count_matrix_based_cfpq(
+    cfg: CFG,
+    graph: nx.DiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    per_start: bool = False,
+) -> int | dict[Hashable, int]:
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    (answer,) = deque(_iter_matrix_based_results(cfg, graph_automaton), maxlen=1)
+    return count_pairs(graph_automaton, answer, per_start)
+
+
+def _iter_tensor_based_results(
+    rsm: RecursiveAutomaton, graph_automaton: AdjacencyMatrixFA, lazy: bool = False
+) -> Iterator[csr_matrix]:
     rsm_automaton = AdjacencyMatrixFA(rsm_to_nfa(rsm))
-    graph_automaton = AdjacencyMatrixFA(graph_to_nfa(graph, start_nodes, final_nodes))
 
     for sym in rsm.labels:
-        if sym not in graph_automaton.adj_decomposition.keys():
-            graph_automaton.adj_decomposition[sym] = csr_matrix(
-                (graph_automaton.number_of_states, graph_automaton.number_of_states),
-                dtype=bool,
-            )
+        graph_automaton.add_symbol(sym)
+
+    n = graph_automaton.number_of_states
+    boxes = list(rsm.boxes.keys())
+    rsm_box = np.array(
+        [boxes.index(symbol) for symbol, _ in rsm_automaton.state_names],
+        dtype=np.int64,
+    )
+    rsm_box_start = np.array(
+        [
+            rsm_state in rsm.boxes[symbol].dfa.start_states
+            for symbol, rsm_state in rsm_automaton.state_names
+        ],
+        dtype=bool,
+    )
+    rsm_box_final = np.array(
+        [
+            rsm_state in rsm.boxes[symbol].dfa.final_states
+            for symbol, rsm_state in rsm_automaton.state_names
+        ],
+        dtype=bool,
+    )
+
+    product_index = ProductIndex(rsm_automaton.number_of_states, n)
+    rsm_starts = np.flatnonzero(rsm_box_start)
+    rows = product_index.encode(
+        np.repeat(rsm_starts, n), np.tile(np.arange(n), rsm_starts.size)
+    )
+
+    initial_id = graph_automaton.add_symbol(rsm.initial_label)
+    yield graph_automaton.matrices[initial_id]
 
     changed = True
 
     while changed:
         changed = False
-        intersection = intersect_automata(rsm_automaton, graph_automaton)
-        transitive_closure = intersection.transitive_сlosure()
-        idx_to_state_mapping = {v: k for k, v in intersection.states.items()}
-
-        for row_id, col_id in zip(*transitive_closure.nonzero()):
-            (row_symbol, row_rsm_state), row_graph_state = idx_to_state_mapping[row_id]
-            (col_symbol, col_rsm_state), col_graph_state = idx_to_state_mapping[col_id]
-
-            dfa = rsm.boxes[row_symbol].dfa
-            if (
-                row_symbol == col_symbol
-                and row_rsm_state in dfa.start_states
-                and col_rsm_state in dfa.final_states
-            ):
-                if not graph_automaton.adj_decomposition[row_symbol][
-                    graph_automaton.states[row_graph_state],
-                    graph_automaton.states[col_graph_state],
-                ]:
-                    graph_automaton.adj_decomposition[row_symbol][
-                        graph_automaton.states[row_graph_state],
-                        graph_automaton.states[col_graph_state],
-                    ] = True
-                    changed = True
-
-    idx_to_node_mapping = {v: k for k, v in graph_automaton.states.items()}
-    return {
-        (idx_to_node_mapping[u], idx_to_node_mapping[v])
-        for u, v in zip(*graph_automaton.adj_decomposition[rsm.initial_label].nonzero())
-        if idx_to_node_mapping[u] in start_nodes
-        and idx_to_node_mapping[v] in final_nodes
-    }
+        intersection = (
+            LazyIntersectionFA(rsm_automaton, graph_automaton)
+            if lazy
+            else intersect_automata(rsm_automaton, graph_automaton)
+        )
+        transitive_closure = intersection.transitive_сlosure(rows).tocoo()
+
+        row_rsm_idx, row_graph_idx = product_index.decode(rows[transitive_closure.row])
+        col_rsm_idx, col_graph_idx = product_index.decode(transitive_closure.col)
+        derived = (rsm_box[row_rsm_idx] == rsm_box[col_rsm_idx]) & rsm_box_final[
+            col_rsm_idx
+        ]
+
+        for box_idx, symbol in enumerate(boxes):
+            box_derived = derived & (rsm_box[row_rsm_idx] == box_idx)
+            sym_id = graph_automaton.symbol_id(symbol)
+            adj_matrix = graph_automaton.matrices[sym_id]
+            updated_matrix = csr_matrix(
+                adj_matrix
+                + csr_matrix(
+                    (
+                        np.ones(np.count_nonzero(box_derived), dtype=bool),
+                        (row_graph_idx[box_derived], col_graph_idx[box_derived]),
+                    ),
+                    shape=(n, n),
+                ),
+                dtype=bool,
+            )
+            if updated_matrix.nnz != adj_matrix.nnz:
+                graph_automaton.matrices[sym_id] = updated_matrix
+                changed = True
+                if sym_id == initial_id:
+                    yield updated_matrix
+
+
+def iter_tensor_based_cfpq(
+    rsm: RecursiveAutomaton,
+    graph: nx.DiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    lazy: bool = False,
+) -> Iterator[tuple[int, int]]:
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    yield from _iter_new_pairs_of_results(
+        graph_automaton, _iter_tensor_based_results(rsm, graph_automaton, lazy)
+    )
+
+
+def tensor_based_cfpq(
+    rsm: RecursiveAutomaton,
+    graph: nx.DiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    lazy: bool = False,
+) -> set[tuple[int, int]]:
+    return set(iter_tensor_based_cfpq(rsm, graph, start_nodes, final_nodes, lazy))
+
+
+def count_tensor_based_cfpq(
+    rsm: RecursiveAutomaton,
+    graph: nx.DiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    lazy: bool = False,
+    per_start: bool = False,
+) -> int | dict[Hashable, int]:
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    (answer,) = deque(_iter_tensor_based_results(rsm, graph_automaton, lazy), maxlen=1)
+    return count_pairs(graph_automaton, answer, per_start)
@@ -0,0 +1,111 @@
+import networkx as nx
+import numpy as np
+
+from copy import copy
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Hashable, Iterable
+
+from project.regular.automatons import AdjacencyMatrixFA, close_epsilon_masks
+
+
+@dataclass
+class LabelStats:
+    edges: int
+    sources: int
+    targets: int
+
+
+class GraphIndex:
+    def __init__(self, graph: nx.MultiDiGraph):
+        self.automaton, self.epsilon_closure = (
+            AdjacencyMatrixFA.from_graph_with_closure(graph)
+        )
+        self.start_attributes = np.array(
+            [data.get("is_start", False) for _, data in graph.nodes(data=True)],
+            dtype=bool,
+        )
+        self.final_attributes = np.array(
+            [data.get("is_final", False) for _, data in graph.nodes(data=True)],
+            dtype=bool,
+        )
+
+        self._saved_directory = None
+
+        self.csr = dict(zip(self.automaton.labels, self.automaton.matrices))
+        self.label_stats = {
+            label: LabelStats(
+                self.csr[label].nnz,
+                np.count_nonzero(np.diff(self.csr[label].indptr)),
+                np.count_nonzero(
+                    np.bincount(self.csr[label].indices, minlength=self.number_of_nodes)
+                ),
+            )
+            for label in self.csr
+        }
+
+    @property
+    def number_of_nodes(self) -> int:
+        return self.automaton.number_of_states
+
+    @property
+    def node_to_index(self) -> dict[Hashable, int]:
+        return self.automaton.states
+
+    @property
+    def index_to_node(self) -> list[Hashable]:
+        return self.automaton.state_names
+
+    @property
+    def labels(self) -> list[Hashable]:
+        return self.automaton.labels
+
+    def _node_mask(self, nodes: Iterable, attributes: np.ndarray) -> np.ndarray:
+        if not nodes:
+            return np.ones(self.number_of_nodes, dtype=bool)
+
+        mask = attributes.copy()
+        mask[
+            [self.node_to_index[node] for node in nodes if node in self.node_to_index]
+        ] = True
+        return mask
+
+    def automaton_for(
+        self, start_nodes: Iterable = None, final_nodes: Iterable = None
+    ) -> AdjacencyMatrixFA:
+        automaton = AdjacencyMatrixFA()
+        automaton.number_of_states = self.automaton.number_of_states
+        automaton.state_names = self.automaton.state_names
+        automaton.states = self.automaton.states
+        automaton.start_mask, automaton.final_mask = close_epsilon_masks(
+            self.epsilon_closure,
+            self._node_mask(start_nodes, self.start_attributes),
+            self._node_mask(final_nodes, self.final_attributes),
+        )
+        automaton.set_transitions(self.automaton.labels, self.automaton.matrices)
+
+        return automaton
+
+    def saved_path(self) -> Path:
+        if self._saved_directory is None:
+            self._saved_directory = TemporaryDirectory()
+            save_by_index(self.automaton, self._saved_directory.name)
+
+        return Path(self._saved_directory.name)
+
+
+def save_by_index(automaton: AdjacencyMatrixFA, path: str | Path):
+    indexed_automaton = copy(automaton)
+    indexed_automaton.state_names = range(automaton.number_of_states)
+    indexed_automaton.save(path)
+
+
+def as_graph_automaton(
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: Iterable = None,
+    final_nodes: Iterable = None,
+) -> AdjacencyMatrixFA:
+    if isinstance(graph, GraphIndex):
+        return graph.automaton_for(start_nodes, final_nodes)
+    return AdjacencyMatrixFA.from_graph(graph, start_nodes, final_nodes)
@@ -1,142 +1,768 @@
+import json
+import networkx as nx
 import numpy as np
 
 from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, Symbol
-from scipy.sparse import csr_matrix, kron
-from typing import Iterable
-from itertools import product
+from scipy.sparse import block_diag, csr_matrix, hstack, kron, vstack
+from typing import Hashable, Iterable, Mapping
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+
+from project.regular.closure import (
+    condensation,
+    condensed_closure,
+    squaring_closure,
+    semi_naive_closure,
+)
+from project.regular.fronts import (
+    block_diagonal,
+    mask_pairs_front,
+    masked_matmul,
+    sparse_front,
+    VisitedMask,
+)
+from project.regular.product import ProductIndex, ProductStateNames, ProductStates
+
+
+JSON_SCALARS = (int, str, float, bool)
+EPSILON_LABELS = ("epsilon", "ɛ")
+
+
+@dataclass
+class EmptinessReport:
+    is_empty: bool
+    levels: int
+    visited_states: int
+
+
+def _label_matrices(
+    number_of_states: int, transitions: Iterable[tuple[int, int, Hashable]]
+) -> tuple[list[Hashable], list[csr_matrix]]:
+    label_ids = dict()
+    edges = np.array(
+        [
+            (from_state, to_state, label_ids.setdefault(label, len(label_ids)))
+            for from_state, to_state, label in transitions
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    edges = edges[np.argsort(edges[:, 2], kind="stable")]
+    bounds = np.searchsorted(edges[:, 2], np.arange(len(label_ids) + 1))
+
+    return list(label_ids.keys()), [
+        csr_matrix(
+            (
+                np.ones(bounds[label_id + 1] - bounds[label_id], dtype=bool),
+                (
+                    edges[bounds[label_id] : bounds[label_id + 1], 0],
+                    edges[bounds[label_id] : bounds[label_id + 1], 1],
+                ),
+            ),
+            shape=(number_of_states, number_of_states),
+        )
+        for label_id in label_ids.values()
+    ]
+
+
+def close_epsilon_masks(
+    closure: csr_matrix | None, start_mask: np.ndarray, final_mask: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    if closure is None:
+        return start_mask, final_mask
+
+    return (
+        start_mask | (closure.T @ start_mask.astype(np.int64) > 0),
+        closure @ final_mask.astype(np.int64) > 0,
+    )
 
 
 class AdjacencyMatrixFA:
+    __slots__ = (
+        "number_of_states",
+        "start_mask",
+        "final_mask",
+        "labels",
+        "label_ids",
+        "matrices",
+        "state_names",
+        "_states",
+    )
+
     def __init__(self, automaton: NondeterministicFiniteAutomaton = None):
+        self.number_of_states = 0
+        self.start_mask = np.zeros(0, dtype=bool)
+        self.final_mask = np.zeros(0, dtype=bool)
+        self.labels = []
+        self.label_ids = dict()
+        self.matrices = []
+        self.state_names = range(0)
+        self._states = None
+
         if automaton is None:
-            self.number_of_states = 0
-            self.states = dict()
-            self.start_states = set()
-            self.final_states = set()
-            self.adj_decomposition = dict()
             return
 
         graph = automaton.to_networkx()
-        self.states = {state_name: i for i, state_name in enumerate(graph.nodes)}
-        self.number_of_states = len(self.states)
+        self.state_names = list(graph.nodes)
+        self.number_of_states = len(self.state_names)
 
-        self.start_states = set(
-            state_name
-            for state_name in self.states.keys()
-            if state_name in automaton.start_states
+        self.start_mask = np.array(
+            [state_name in automaton.start_states for state_name in self.state_names],
+            dtype=bool,
+        )
+        self.final_mask = np.array(
+            [state_name in automaton.final_states for state_name in self.state_names],
+            dtype=bool,
         )
 
-        self.final_states = set(
-            state_name
-            for state_name in self.states.keys()
-            if state_name in automaton.final_states
+        self.set_transitions(
+            *_label_matrices(
+                self.number_of_states,
+                (
+                    (self.states[st1], self.states[st2], label)
+                    for st1, st2, label in graph.edges(data="label")
+                    if label
+                ),
+            )
         )
 
-        transitions = {
-            sym: np.zeros((self.number_of_states, self.number_of_states), dtype=bool)
-            for sym in automaton.symbols
-        }
+    @classmethod
+    def from_graph(
+        cls,
+        graph: nx.MultiDiGraph,
+        start_nodes: Iterable = None,
+        final_nodes: Iterable = None,
+    ) -> "AdjacencyMatrixFA":
+        return cls.from_graph_with_closure(graph, start_nodes, final_nodes)[0]
+
+    @classmethod
+    def from_graph_with_closure(
+        cls,
+        graph: nx.MultiDiGraph,
+        start_nodes: Iterable = None,
+        final_nodes: Iterable = None,
+    ) -> tuple["AdjacencyMatrixFA", csr_matrix | None]:
+        start_nodes = set(start_nodes) if start_nodes else set(graph.nodes)
+        final_nodes = set(final_nodes) if final_nodes else set(graph.nodes)
+
+        automaton = cls()
+        automaton.state_names = list(graph.nodes)
+        automaton.number_of_states = len(automaton.state_names)
+
+        labels, matrices = _label_matrices(
+            automaton.number_of_states,
+            (
+                (automaton.states[u], automaton.states[v], label)
+                for u, v, label in graph.edges(data="label")
+                if label
+            ),
+        )
+        closure = None
+        if any(label in EPSILON_LABELS for label in labels):
+            epsilon = csr_matrix(
+                (automaton.number_of_states, automaton.number_of_states), dtype=bool
+            )
+            for label, adj_matrix in zip(labels, matrices):
+                if label in EPSILON_LABELS:
+                    epsilon = epsilon + adj_matrix
+            closure = squaring_closure(epsilon)
+
+            labels, matrices = (
+                [label for label in labels if label not in EPSILON_LABELS],
+                [
+                    csr_matrix(closure @ adj_matrix, dtype=bool)
+                    for label, adj_matrix in zip(labels, matrices)
+                    if label not in EPSILON_LABELS
+                ],
+            )
+        automaton.set_transitions(labels, matrices)
+
+        automaton.start_mask, automaton.final_mask = close_epsilon_masks(
+            closure,
+            np.array(
+                [
+                    node in start_nodes or data.get("is_start", False)
+                    for node, data in graph.nodes(data=True)
+                ],
+                dtype=bool,
+            ),
+            np.array(
+                [
+                    node in final_nodes or data.get("is_final", False)
+                    for node, data in graph.nodes(data=True)
+                ],
+                dtype=bool,
+            ),
+        )
 
-        for st1, st2, label in graph.edges(data="label"):
-            if not label:
-                continue
+        return automaton, closure
 
-            from_state = self.states[st1]
-            to_state = self.states[st2]
-            transitions[label][from_state, to_state] = 1
+    def save(self, path: str | Path):
+        path = Path(path)
+        state_names = names_array(self.state_names)
+        names_as_array = state_names.ndim == 1 and state_names.dtype.kind in "iu"
+        _check_json_scalars("label", self.labels)
+        if not names_as_array:
+            _check_json_scalars("state name", self.state_names)
 
-        self.adj_decomposition = {
-            label: csr_matrix(matrix) for label, matrix in transitions.items()
+        path.mkdir(parents=True, exist_ok=True)
+        if names_as_array:
+            np.save(path / "state_names.npy", state_names.astype(np.int64))
+        np.save(path / "start_mask.npy", self.start_mask)
+        np.save(path / "final_mask.npy", self.final_mask)
+        for sym_id, adj_matrix in enumerate(self.matrices):
+            adj_matrix = csr_matrix(adj_matrix, dtype=bool)
+            adj_matrix.sum_duplicates()
+            np.save(path / f"{sym_id}_indptr.npy", adj_matrix.indptr)
+            np.save(path / f"{sym_id}_indices.npy", adj_matrix.indices)
+            np.save(path / f"{sym_id}_data.npy", adj_matrix.data)
+
+        meta = {
+            "number_of_states": self.number_of_states,
+            "labels": self.labels,
+            "state_names": None if names_as_array else list(self.state_names),
         }
+        with open(path / "meta.json", "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path: str | Path, mmap: bool = True) -> "AdjacencyMatrixFA":
+        path = Path(path)
+        mmap_mode = "r" if mmap else None
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+
+        automaton = cls()
+        automaton.number_of_states = meta["number_of_states"]
+        automaton.state_names = (
+            np.load(path / "state_names.npy", mmap_mode=mmap_mode)
+            if meta["state_names"] is None
+            else meta["state_names"]
+        )
+        automaton.start_mask = np.load(path / "start_mask.npy", mmap_mode=mmap_mode)
+        automaton.final_mask = np.load(path / "final_mask.npy", mmap_mode=mmap_mode)
+        automaton.set_transitions(
+            meta["labels"],
+            (
+                csr_matrix(
+                    (
+                        np.load(path / f"{sym_id}_data.npy", mmap_mode=mmap_mode),
+                        np.load(path / f"{sym_id}_indices.npy", mmap_mode=mmap_mode),
+                        np.load(path / f"{sym_id}_indptr.npy", mmap_mode=mmap_mode),
+                    ),
+                    shape=(automaton.number_of_states, automaton.number_of_states),
+                    copy=False,
+                )
+                for sym_id in range(len(meta["labels"]))
+            ),
+        )
+
+        return automaton
 
     @property
-    def symbols(self):
-        return set(self.adj_decomposition.keys())
+    def states(self) -> Mapping[Hashable, int]:
+        if self._states is None:
+            self._states = {
+                state_name: i for i, state_name in enumerate(self.state_names)
+            }
+        return self._states
+
+    @states.setter
+    def states(self, states: Mapping[Hashable, int]):
+        self._states = states
+
+    @property
+    def symbols(self) -> set:
+        return set(self.labels)
+
+    @property
+    def adj_decomposition(self) -> Mapping[Hashable, csr_matrix]:
+        return MappingProxyType(dict(zip(self.labels, self.matrices)))
+
+    @property
+    def start_states(self) -> set:
+        return set(self.state_names[i] for i in np.flatnonzero(self.start_mask))
+
+    @property
+    def final_states(self) -> set:
+        return set(self.state_names[i] for i in np.flatnonzero(self.final_mask))
+
+    def set_transitions(self, labels: Iterable[Hashable], matrices: Iterable):
+        self.labels = list(labels)
+        self.label_ids = {label: i for i, label in enumerate(self.labels)}
+        self.matrices = list(matrices)
+
+    def symbol_id(self, sym: Hashable) -> int | None:
+        return self.label_ids.get(sym)
+
+    def matrix(self, sym: Hashable) -> csr_matrix | None:
+        sym_id = self.label_ids.get(sym)
+        return None if sym_id is None else self.matrices[sym_id]
+
+    def add_symbol(self, sym: Hashable) -> int:
+        if sym not in self.label_ids:
+            self.label_ids[sym] = len(self.labels)
+            self.labels.append(sym)
+            self.matrices.append(
+                csr_matrix((self.number_of_states, self.number_of_states), dtype=bool)
+            )
+
+        return self.label_ids[sym]
 
     def accepts(self, word: Iterable[Symbol]) -> bool:
-        current_states = {state for state in self.start_states}
+        current_states = self.start_mask
 
         for sym in word:
-            next_states = set()
+            adj_matrix = self.matrix(sym)
+            if adj_matrix is None:
+                return False
 
-            if self.adj_decomposition.get(sym) is None:
+            current_states = current_states @ adj_matrix
+            if not current_states.any():
                 return False
 
-            for from_state in current_states:
-                for to_state in self.states.keys():
-                    if self.adj_decomposition[sym][
-                        self.states[from_state], self.states[to_state]
-                    ]:
-                        next_states.add(to_state)
+        return bool((current_states & self.final_mask).any())
 
-            current_states = next_states
+    def accepts_many(self, words: Iterable[Iterable[Symbol]]) -> list[bool]:
+        trie = dict()
+        levels = []
+        word_ends = []
 
-        for state in current_states:
-            if state in self.final_states:
-                return True
+        for word in words:
+            node = 0
+            for depth, sym in enumerate(word):
+                child = trie.get((node, sym))
+                if child is None:
+                    child = len(trie) + 1
+                    trie[(node, sym)] = child
+                    if depth == len(levels):
+                        levels.append(defaultdict(lambda: ([], [])))
+                    children, parents = levels[depth][sym]
+                    children.append(child)
+                    parents.append(node)
+                node = child
+            word_ends.append(node)
 
-        return False
+        reached = np.zeros((len(trie) + 1, self.number_of_states), dtype=bool)
+        reached[0] = self.start_mask
 
-    def transitive_сlosure(self) -> np.ndarray:
-        A = np.eye(self.number_of_states, dtype=bool)
+        for level in levels:
+            for sym, (children, parents) in level.items():
+                adj_matrix = self.matrix(sym)
+                if adj_matrix is None:
+                    continue
+                reached[children] = reached[parents] @ adj_matrix
 
-        for adj_matrix in self.adj_decomposition.values():
-            A |= adj_matrix.toarray().astype(bool)
+        accepted = reached[word_ends] & self.final_mask
+        return accepted.any(axis=1).tolist()
 
-        closure = A.copy()
-        for _ in range(self.number_of_states):
-            prev = closure.copy()
-            closure = np.matmul(closure, A).astype(bool)
-            if np.array_equal(closure, prev):
-                return closure
+    def reversed(self) -> "AdjacencyMatrixFA":
+        reversed_automaton = AdjacencyMatrixFA()
+        reversed_automaton.number_of_states = self.number_of_states
+        reversed_automaton.state_names = self.state_names
+        reversed_automaton.states = self._states
+        reversed_automaton.start_mask = self.final_mask
+        reversed_automaton.final_mask = self.start_mask
+        reversed_automaton.set_transitions(
+            self.labels, (adj_matrix.T.tocsr() for adj_matrix in self.matrices)
+        )
 
-        return closure
+        return reversed_automaton
 
-    def is_empty(self) -> bool:
-        closure = self.transitive_сlosure()
-        for start_state in self.start_states:
-            for final_state in self.final_states:
-                if closure[self.states[start_state], self.states[final_state]]:
-                    return False
+    def adjacency_matrix(self) -> csr_matrix:
+        adjacency = csr_matrix(
+            (self.number_of_states, self.number_of_states), dtype=bool
+        )
+        for adj_matrix in self.matrices:
+            adjacency = adjacency + adj_matrix
 
-        return True
+        return csr_matrix(adjacency, dtype=bool)
 
+    def transitive_сlosure(
+        self,
+        rows: Iterable[int] = None,
+        max_length: int = None,
+        min_length: int = 0,
+        condense: bool = False,
+    ) -> csr_matrix:
+        if condense and max_length is None and min_length == 0:
+            return condensed_closure(
+                self.adjacency_matrix(),
+                None if rows is None else np.fromiter(rows, dtype=np.int64),
+            )
+        if rows is None and max_length is None and min_length == 0:
+            return squaring_closure(self.adjacency_matrix())
 
-def intersect_automata(
+        rows = (
+            np.arange(self.number_of_states)
+            if rows is None
+            else np.fromiter(rows, dtype=np.int64)
+        )
+        return semi_naive_closure(self.adjacency_matrix(), rows, max_length, min_length)
+
+    def emptiness_report(self, condense: bool = False) -> EmptinessReport:
+        adjacency = self.adjacency_matrix()
+        start_mask, final_mask = self.start_mask, self.final_mask
+        sizes = np.ones(self.number_of_states, dtype=np.int64)
+        if condense:
+            components, adjacency = condensation(adjacency)
+            n_of_components = adjacency.shape[0]
+            start_mask = np.bincount(
+                components, weights=start_mask, minlength=n_of_components
+            ).astype(bool)
+            final_mask = np.bincount(
+                components, weights=final_mask, minlength=n_of_components
+            ).astype(bool)
+            sizes = np.bincount(components, minlength=n_of_components)
+
+        visited = start_mask.copy()
+        front = np.flatnonzero(visited)
+        levels = 0
+        while front.size > 0:
+            if final_mask[front].any():
+                return EmptinessReport(False, levels, int(sizes[visited].sum()))
+
+            successors = np.unique(adjacency[front].indices)
+            front = successors[~visited[successors]]
+            visited[front] = True
+            levels += 1
+
+        return EmptinessReport(True, levels, int(sizes[visited].sum()))
+
+    def is_empty(self, condense: bool = False) -> bool:
+        return self.emptiness_report(condense).is_empty
+
+
+def _check_json_scalars(kind: str, values: Iterable):
+    for value in values:
+        if value is not None and type(value) not in JSON_SCALARS:
+            raise ValueError(
+                f"Cannot save {kind} {value!r}: "
+                "only int, str, float, bool and None values are supported"
+            )
+
+
+def names_array(state_names: Iterable[Hashable]) -> np.ndarray:
+    if isinstance(state_names, np.ndarray):
+        return state_names
+
+    names = np.fromiter(state_names, dtype=object, count=len(state_names))
+    if all(
+        isinstance(name, np.integer) or (type(name) is int and -(2**63) <= name < 2**63)
+        for name in names
+    ):
+        return names.astype(np.int64)
+    return names
+
+
+def shared_symbols(
     automaton1: AdjacencyMatrixFA, automaton2: AdjacencyMatrixFA
+) -> list[tuple[Hashable, int, int]]:
+    return [
+        (label, sym_id1, automaton2.label_ids[label])
+        for sym_id1, label in enumerate(automaton1.labels)
+        if label in automaton2.label_ids
+    ]
+
+
+def disjoint_union(
+    automata: list[AdjacencyMatrixFA],
+) -> tuple[AdjacencyMatrixFA, np.ndarray]:
+    union = AdjacencyMatrixFA()
+    union.number_of_states = sum(automaton.number_of_states for automaton in automata)
+    union.state_names = [
+        (component, state_name)
+        for component, automaton in enumerate(automata)
+        for state_name in automaton.state_names
+    ]
+    union.start_mask = np.concatenate(
+        [automaton.start_mask for automaton in automata] + [union.start_mask]
+    )
+    union.final_mask = np.concatenate(
+        [automaton.final_mask for automaton in automata] + [union.final_mask]
+    )
+
+    labels = list(
+        dict.fromkeys(label for automaton in automata for label in automaton.labels)
+    )
+    union.set_transitions(
+        labels,
+        (
+            block_diag(
+                [
+                    csr_matrix(
+                        (automaton.number_of_states, automaton.number_of_states),
+                        dtype=bool,
+                    )
+                    if automaton.matrix(label) is None
+                    else automaton.matrix(label)
+                    for automaton in automata
+                ],
+                format="csr",
+                dtype=bool,
+            )
+            for label in labels
+        ),
+    )
+
+    return union, np.repeat(
+        np.arange(len(automata)),
+        [automaton.number_of_states for automaton in automata],
+    )
+
+
+def _product_automaton(
+    automaton1: AdjacencyMatrixFA,
+    automaton2: AdjacencyMatrixFA,
+    product_index: ProductIndex,
 ) -> AdjacencyMatrixFA:
     intersection = AdjacencyMatrixFA()
+    intersection.number_of_states = product_index.number_of_states
+    intersection.states = ProductStates(automaton1, automaton2, product_index)
+    intersection.state_names = ProductStateNames(
+        automaton1.state_names, automaton2.state_names, product_index
+    )
 
-    intersection.number_of_states = (
-        automaton1.number_of_states * automaton2.number_of_states
+    intersection.start_mask = product_index.combine_masks(
+        automaton1.start_mask, automaton2.start_mask
+    )
+    intersection.final_mask = product_index.combine_masks(
+        automaton1.final_mask, automaton2.final_mask
     )
-    intersection.states = {
-        (st1, st2): automaton1.states[st1] * automaton2.number_of_states
-        + automaton2.states[st2]
-        for st1, st2 in product(automaton1.states.keys(), automaton2.states.keys())
-    }
 
-    intersection.start_states = set(
-        state_name
-        for state_name in intersection.states.keys()
-        if state_name[0] in automaton1.start_states
-        and state_name[1] in automaton2.start_states
+    return intersection
+
+
+def intersect_automata(
+    automaton1: AdjacencyMatrixFA, automaton2: AdjacencyMatrixFA
+) -> AdjacencyMatrixFA:
+    product_index = ProductIndex(
+        automaton1.number_of_states, automaton2.number_of_states
     )
+    intersection = _product_automaton(automaton1, automaton2, product_index)
 
-    intersection.final_states = set(
-        state_name
-        for state_name in intersection.states.keys()
-        if state_name[0] in automaton1.final_states
-        and state_name[1] in automaton2.final_states
+    symbols = shared_symbols(automaton1, automaton2)
+    intersection.set_transitions(
+        (label for label, _, _ in symbols),
+        (
+            kron(
+                automaton1.matrices[sym_id1],
+                automaton2.matrices[sym_id2],
+                format="csr",
+            )
+            for _, sym_id1, sym_id2 in symbols
+        ),
     )
 
-    for key in automaton1.adj_decomposition.keys():
-        if automaton2.adj_decomposition.get(key) is None:
-            continue
-        intersection.adj_decomposition[key] = kron(
-            automaton1.adj_decomposition[key],
-            automaton2.adj_decomposition[key],
+    return intersection
+
+
+class LazyIntersectionFA:
+    def __init__(self, automaton1: AdjacencyMatrixFA, automaton2: AdjacencyMatrixFA):
+        self.automaton1 = automaton1
+        self.automaton2 = automaton2
+        self.product_index = ProductIndex(
+            automaton1.number_of_states, automaton2.number_of_states
+        )
+        self.number_of_states = self.product_index.number_of_states
+        self.states = ProductStates(automaton1, automaton2, self.product_index)
+        self._shared_symbols = shared_symbols(automaton1, automaton2)
+        self._block_transitions = dict()
+        self._stacked_transitions = None
+
+    @property
+    def symbols(self):
+        return self.automaton1.symbols.intersection(self.automaton2.symbols)
+
+    def _block_transition(self, sym_id: int, n_of_blocks: int) -> csr_matrix:
+        if (sym_id, n_of_blocks) not in self._block_transitions:
+            self._block_transitions[(sym_id, n_of_blocks)] = block_diagonal(
+                self.automaton1.matrices[sym_id].T, n_of_blocks
+            )
+
+        return self._block_transitions[(sym_id, n_of_blocks)]
+
+    def _stacked_transition(self) -> csr_matrix:
+        if self._stacked_transitions is None:
+            self._stacked_transitions = csr_matrix(
+                vstack(
+                    [
+                        self.automaton2.matrices[sym_id2]
+                        for _, _, sym_id2 in self._shared_symbols
+                    ],
+                    format="csr",
+                ),
+                dtype=bool,
+            )
+
+        return self._stacked_transitions
+
+    def step(self, front: csr_matrix, visited: VisitedMask = None) -> csr_matrix:
+        n_of_blocks = front.shape[0] // self.automaton1.number_of_states
+        if not self._shared_symbols:
+            return csr_matrix(front.shape, dtype=bool)
+
+        moved = hstack(
+            [
+                self._block_transition(sym_id1, n_of_blocks) @ front
+                for _, sym_id1, _ in self._shared_symbols
+            ],
             format="csr",
         )
+        if visited is None:
+            return csr_matrix(moved @ self._stacked_transition(), dtype=bool)
+        return masked_matmul(moved, self._stacked_transition(), visited.matrix)
+
+    def reachable(
+        self, front: csr_matrix, max_length: int = None, min_length: int = 0
+    ) -> csr_matrix:
+        if max_length is not None and max_length < min_length:
+            return csr_matrix(front.shape, dtype=bool)
+        for _ in range(min_length):
+            front = csr_matrix(self.step(front))
+
+        visited = VisitedMask(front)
+        levels = min_length
+        while front.nnz > 0 and (max_length is None or levels < max_length):
+            front = self.step(front, visited)
+            visited.add(front)
+            levels += 1
+
+        return visited.matrix
+
+    def bfs_levels(self, front: csr_matrix, max_length: int = None) -> list[csr_matrix]:
+        visited = VisitedMask(front)
+        levels = [visited.matrix]
+        while levels[-1].nnz > 0 and (max_length is None or len(levels) <= max_length):
+            front = self.step(levels[-1], visited)
+            visited.add(front)
+            levels.append(front)
+
+        if levels[-1].nnz == 0 and len(levels) > 1:
+            levels.pop()
+        return levels
+
+    def transitive_сlosure(
+        self,
+        rows: Iterable[int] = None,
+        max_length: int = None,
+        min_length: int = 0,
+        condense: bool = False,
+    ) -> csr_matrix:
+        if condense:
+            raise ValueError("SCC condensation requires a materialized intersection")
+
+        rows = (
+            np.arange(self.number_of_states)
+            if rows is None
+            else np.fromiter(rows, dtype=np.int64)
+        )
+        if self.number_of_states == 0 or rows.size == 0:
+            return csr_matrix((rows.size, self.number_of_states), dtype=bool)
+
+        n1 = self.automaton1.number_of_states
+        n2 = self.automaton2.number_of_states
+        first, second = self.product_index.decode(rows)
+        front = sparse_front(
+            np.arange(rows.size) * n1 + first, second, (rows.size * n1, n2)
+        )
+
+        reached = self.reachable(front, max_length, min_length).tocoo()
+        blocks, first = np.divmod(reached.row, n1)
+        return csr_matrix(
+            (reached.data, (blocks, self.product_index.encode(first, reached.col))),
+            shape=(rows.size, self.number_of_states),
+            dtype=bool,
+        )
+
+    def emptiness_report(self) -> EmptinessReport:
+        automaton1, automaton2 = self.automaton1, self.automaton2
+
+        front = mask_pairs_front(automaton1.start_mask, automaton2.start_mask)
+        visited = VisitedMask(front)
+        levels = 0
+        while front.nnz > 0:
+            first, second = front.nonzero()
+            if (automaton1.final_mask[first] & automaton2.final_mask[second]).any():
+                return EmptinessReport(False, levels, visited.matrix.nnz)
+
+            front = self.step(front, visited)
+            visited.add(front)
+            levels += 1
+
+        return EmptinessReport(True, levels, visited.matrix.nnz)
+
+    def is_empty(self) -> bool:
+        return self.emptiness_report().is_empty
+
+
+def _restricted_kron(
+    matrix1: csr_matrix,
+    matrix2: csr_matrix,
+    first: np.ndarray,
+    second: np.ndarray,
+    kept: np.ndarray,
+) -> csr_matrix:
+    if kept.size == 0:
+        return csr_matrix((0, 0), dtype=bool)
+
+    rows1 = matrix1[first]
+    rows2 = matrix2[second]
+    counts1 = np.diff(rows1.indptr)
+    counts2 = np.diff(rows2.indptr)
+    counts = counts1 * counts2
+
+    sources = np.repeat(np.arange(kept.size), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    targets = (
+        rows1.indices[rows1.indptr[sources] + offsets // counts2[sources]]
+        * matrix2.shape[1]
+        + rows2.indices[rows2.indptr[sources] + offsets % counts2[sources]]
+    )
+
+    positions = np.minimum(np.searchsorted(kept, targets), kept.size - 1)
+    valid = kept[positions] == targets
+    return csr_matrix(
+        (np.ones(valid.sum(), dtype=bool), (sources[valid], positions[valid])),
+        shape=(kept.size, kept.size),
+    )
+
+
+def intersect_automata_trimmed(
+    automaton1: AdjacencyMatrixFA, automaton2: AdjacencyMatrixFA
+) -> AdjacencyMatrixFA:
+    forward = LazyIntersectionFA(automaton1, automaton2)
+    backward = LazyIntersectionFA(automaton1.reversed(), automaton2.reversed())
+
+    reachable = forward.reachable(
+        mask_pairs_front(automaton1.start_mask, automaton2.start_mask)
+    )
+    coreachable = backward.reachable(
+        mask_pairs_front(automaton1.final_mask, automaton2.final_mask)
+    )
+    first, second = csr_matrix(reachable.multiply(coreachable)).nonzero()
+
+    kept = np.sort(forward.product_index.encode(first, second))
+    product_index = ProductIndex(
+        automaton1.number_of_states, automaton2.number_of_states, kept
+    )
+    intersection = _product_automaton(automaton1, automaton2, product_index)
+    first, second = product_index.decode(np.arange(kept.size))
+
+    symbols = shared_symbols(automaton1, automaton2)
+    intersection.set_transitions(
+        (label for label, _, _ in symbols),
+        (
+            _restricted_kron(
+                automaton1.matrices[sym_id1],
+                automaton2.matrices[sym_id2],
+                first,
+                second,
+                kept,
+            )
+            for _, sym_id1, sym_id2 in symbols
+        ),
+    )
 
     return intersection
@@ -0,0 +1,99 @@
+import numpy as np
+
+from scipy.sparse import csr_matrix, identity
+from scipy.sparse.csgraph import connected_components
+
+from project.regular.fronts import masked_matmul, sparse_front
+
+
+def squaring_closure(adjacency: csr_matrix) -> csr_matrix:
+    closure = csr_matrix(
+        identity(adjacency.shape[0], dtype=bool, format="csr") + adjacency,
+        dtype=bool,
+    )
+
+    while True:
+        squared = closure @ closure
+        if squared.nnz == closure.nnz:
+            return closure
+        closure = squared
+
+
+def semi_naive_closure(
+    adjacency: csr_matrix,
+    rows: np.ndarray,
+    max_length: int = None,
+    min_length: int = 0,
+) -> csr_matrix:
+    rows = np.asarray(rows, dtype=np.int64)
+    reached = sparse_front(np.arange(len(rows)), rows, (len(rows), adjacency.shape[1]))
+    if max_length is not None and max_length < min_length:
+        return csr_matrix(reached.shape, dtype=bool)
+    for _ in range(min_length):
+        reached = csr_matrix(reached @ adjacency, dtype=bool)
+
+    delta = reached
+    levels = min_length
+    while delta.nnz > 0 and (max_length is None or levels < max_length):
+        delta = masked_matmul(delta, adjacency, reached)
+        reached = reached + delta
+        levels += 1
+
+    return reached
+
+
+def condensation(adjacency: csr_matrix) -> tuple[np.ndarray, csr_matrix]:
+    n_of_components, components = connected_components(
+        adjacency, directed=True, connection="strong"
+    )
+    membership = sparse_front(
+        np.arange(components.size), components, (components.size, n_of_components)
+    )
+    dag = csr_matrix(membership.T @ adjacency @ membership, dtype=bool)
+
+    return components, csr_matrix(
+        dag > identity(n_of_components, dtype=bool, format="csr")
+    )
+
+
+def _component_closure(dag: csr_matrix) -> csr_matrix:
+    n_of_components = dag.shape[0]
+    dag_columns = dag.tocsc()
+
+    reach = identity(n_of_components, dtype=bool, format="csr")
+    out_degrees = np.diff(dag.indptr)
+    done = np.zeros(n_of_components, dtype=bool)
+    while not done.all():
+        level = np.flatnonzero((out_degrees == 0) & ~done)
+        scatter = sparse_front(
+            level, np.arange(level.size), (n_of_components, level.size)
+        )
+        reach = reach + scatter @ (dag[level] @ reach)
+
+        done[level] = True
+        out_degrees -= np.bincount(
+            dag_columns[:, level].indices, minlength=n_of_components
+        )
+
+    return reach
+
+
+def condensed_closure(adjacency: csr_matrix, rows: np.ndarray = None) -> csr_matrix:
+    components, dag = condensation(adjacency)
+    membership = sparse_front(
+        np.arange(components.size), components, (components.size, dag.shape[0])
+    )
+    if rows is None:
+        return csr_matrix(
+            membership @ _component_closure(dag) @ membership.T, dtype=bool
+        )
+
+    row_components, row_index = np.unique(
+        components[np.asarray(rows, dtype=np.int64)], return_inverse=True
+    )
+    row_membership = sparse_front(
+        np.arange(row_index.size), row_index, (row_index.size, row_components.size)
+    )
+    reach = semi_naive_closure(dag, row_components)
+
+    return csr_matrix(row_membership @ reach @ membership.T, dtype=bool)
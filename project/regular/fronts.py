@@ -0,0 +1,68 @@
+import numpy as np
+
+from scipy.sparse import csr_matrix, identity, kron
+
+MIN_SKIPPED_MASK_ENTRIES = 1 << 15
+
+
+def sparse_front(
+    rows: np.ndarray, cols: np.ndarray, shape: tuple[int, int]
+) -> csr_matrix:
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    front = csr_matrix(
+        (np.ones(rows.size, dtype=bool), (rows, cols)), shape=shape, dtype=bool
+    )
+    front.sum_duplicates()
+
+    return front
+
+
+def mask_pairs_front(mask1: np.ndarray, mask2: np.ndarray) -> csr_matrix:
+    first, second = np.meshgrid(
+        np.flatnonzero(mask1), np.flatnonzero(mask2), indexing="ij"
+    )
+
+    return sparse_front(first.ravel(), second.ravel(), (mask1.size, mask2.size))
+
+
+def multi_source_front(
+    block_mask: np.ndarray, sources: np.ndarray, number_of_columns: int
+) -> csr_matrix:
+    sources = np.asarray(sources, dtype=np.int64)
+    block_states = np.flatnonzero(block_mask)
+    blocks = np.repeat(np.arange(sources.size), block_states.size)
+
+    return sparse_front(
+        blocks * block_mask.size + np.tile(block_states, sources.size),
+        sources[blocks],
+        (sources.size * block_mask.size, number_of_columns),
+    )
+
+
+def masked_matmul(left: csr_matrix, right: csr_matrix, mask: csr_matrix) -> csr_matrix:
+    shape = (left.shape[0], right.shape[1])
+    rows = np.flatnonzero(np.diff(left.indptr))
+    skipped = mask.nnz - np.diff(mask.indptr)[rows].sum()
+    if 2 * skipped < mask.nnz or skipped < MIN_SKIPPED_MASK_ENTRIES:
+        return csr_matrix(left @ right > mask, dtype=bool)
+
+    product = csr_matrix(left[rows] @ right > mask[rows], dtype=bool).tocoo()
+
+    return sparse_front(rows[product.row], product.col, shape)
+
+
+def block_diagonal(matrix: csr_matrix, n_of_blocks: int) -> csr_matrix:
+    return kron(identity(n_of_blocks, dtype=bool, format="csr"), matrix, format="csr")
+
+
+class VisitedMask:
+    def __init__(self, visited: csr_matrix):
+        self.matrix = csr_matrix(visited, dtype=bool)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.matrix.shape
+
+    def add(self, front: csr_matrix):
+        self.matrix = self.matrix + front
@@ -0,0 +1,358 @@
+import networkx as nx
+import numpy as np
+
+from scipy.sparse import csr_matrix, diags, vstack
+from typing import Hashable, Iterable
+
+from project.graph_index import GraphIndex, as_graph_automaton
+from project.regular.automatons import AdjacencyMatrixFA, LazyIntersectionFA
+from project.regular.fronts import VisitedMask, block_diagonal, sparse_front
+from project.regular.regex_cache import regex_cache
+
+
+def _resized(matrix: csr_matrix, shape: tuple[int, int]) -> csr_matrix:
+    matrix = matrix.tocoo()
+    return csr_matrix((matrix.data, (matrix.row, matrix.col)), shape=shape, dtype=bool)
+
+
+def _snapshot(automaton: AdjacencyMatrixFA) -> AdjacencyMatrixFA:
+    snapshot = AdjacencyMatrixFA()
+    snapshot.number_of_states = automaton.number_of_states
+    snapshot.state_names = automaton.state_names
+    snapshot.start_mask = automaton.start_mask
+    snapshot.final_mask = automaton.final_mask
+    snapshot.set_transitions(automaton.labels, automaton.matrices)
+
+    return snapshot
+
+
+class IncrementalRPQ:
+    def __init__(
+        self,
+        regex: str,
+        graph: nx.MultiDiGraph | GraphIndex,
+        start_nodes: set[int] = None,
+        final_nodes: set[int] = None,
+        recompute_threshold: float = 0.5,
+    ):
+        self.regex_automaton = regex_cache.automaton(regex)
+        self.graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+        self.graph_automaton.state_names = list(self.graph_automaton.state_names)
+        self.graph_automaton.states = dict(self.graph_automaton.states)
+        self.start_nodes = set(start_nodes) if start_nodes else set()
+        self.final_nodes = set(final_nodes) if final_nodes else set()
+        self.recompute_threshold = recompute_threshold
+        self.removed = np.zeros(self.graph_automaton.number_of_states, dtype=bool)
+        self.initial_start_mask = self.graph_automaton.start_mask.copy()
+        self.initial_final_mask = self.graph_automaton.final_mask.copy()
+
+        self.graph_starts = np.flatnonzero(self.graph_automaton.start_mask)
+        self.block_of = {int(start): i for i, start in enumerate(self.graph_starts)}
+        self._recompute()
+
+    def _intersection(
+        self, graph_automaton: AdjacencyMatrixFA = None
+    ) -> LazyIntersectionFA:
+        return LazyIntersectionFA(
+            self.regex_automaton,
+            self.graph_automaton if graph_automaton is None else graph_automaton,
+        )
+
+    def _start_front(self, blocks: np.ndarray) -> csr_matrix:
+        n_of_regex_states = self.regex_automaton.number_of_states
+        regex_starts = np.flatnonzero(self.regex_automaton.start_mask)
+        blocks = np.asarray(blocks, dtype=np.int64)
+
+        return sparse_front(
+            np.repeat(blocks * n_of_regex_states, regex_starts.size)
+            + np.tile(regex_starts, blocks.size),
+            np.repeat(self.graph_starts[blocks], regex_starts.size),
+            (
+                self.graph_starts.size * n_of_regex_states,
+                self.graph_automaton.number_of_states,
+            ),
+        )
+
+    def _active_blocks(self) -> np.ndarray:
+        return np.flatnonzero(self.graph_automaton.start_mask[self.graph_starts])
+
+    def _recompute(self):
+        self.visited = VisitedMask(
+            self._intersection().reachable(self._start_front(self._active_blocks()))
+        )
+        self.answer = self._pairs(self.visited.matrix)
+
+    def _pairs(self, reached: csr_matrix) -> set[tuple[Hashable, Hashable]]:
+        rows, graph_finals = reached.nonzero()
+        blocks, regex_finals = np.divmod(rows, self.regex_automaton.number_of_states)
+        graph_starts = self.graph_starts[blocks]
+        answer = (
+            self.regex_automaton.final_mask[regex_finals]
+            & self.graph_automaton.final_mask[graph_finals]
+            & self.graph_automaton.start_mask[graph_starts]
+        )
+
+        graph_state_names = self.graph_automaton.state_names
+        return set(
+            (graph_state_names[start], graph_state_names[final])
+            for start, final in zip(
+                graph_starts[answer].tolist(), graph_finals[answer].tolist()
+            )
+        )
+
+    @property
+    def pairs(self) -> set[tuple[Hashable, Hashable]]:
+        return set(self.answer)
+
+    def _is_start(self, node: Hashable) -> bool:
+        index = self.graph_automaton.states[node]
+        if index < self.initial_start_mask.size:
+            return bool(self.initial_start_mask[index])
+        return not self.start_nodes or node in self.start_nodes
+
+    def _is_final(self, node: Hashable) -> bool:
+        index = self.graph_automaton.states[node]
+        if index < self.initial_final_mask.size:
+            return bool(self.initial_final_mask[index])
+        return not self.final_nodes or node in self.final_nodes
+
+    def _add_nodes(self, nodes: list[Hashable]):
+        graph_automaton = self.graph_automaton
+        n_of_states = graph_automaton.number_of_states + len(nodes)
+        for node in nodes:
+            graph_automaton.states[node] = len(graph_automaton.state_names)
+            graph_automaton.state_names.append(node)
+        graph_automaton.number_of_states = n_of_states
+
+        graph_automaton.start_mask = np.concatenate(
+            [graph_automaton.start_mask, np.zeros(len(nodes), dtype=bool)]
+        )
+        graph_automaton.final_mask = np.concatenate(
+            [graph_automaton.final_mask, np.zeros(len(nodes), dtype=bool)]
+        )
+        self.removed = np.concatenate([self.removed, np.ones(len(nodes), dtype=bool)])
+        graph_automaton.set_transitions(
+            graph_automaton.labels,
+            (
+                _resized(adj_matrix, (n_of_states, n_of_states))
+                for adj_matrix in graph_automaton.matrices
+            ),
+        )
+        self.visited = VisitedMask(
+            _resized(self.visited.matrix, (self.visited.shape[0], n_of_states))
+        )
+
+    def _activate(self, nodes: list[Hashable]) -> csr_matrix:
+        graph_automaton = self.graph_automaton
+        indices = np.array([graph_automaton.states[node] for node in nodes], dtype=int)
+        graph_automaton.start_mask = graph_automaton.start_mask.copy()
+        graph_automaton.final_mask = graph_automaton.final_mask.copy()
+        graph_automaton.start_mask[indices] = [self._is_start(node) for node in nodes]
+        graph_automaton.final_mask[indices] = [self._is_final(node) for node in nodes]
+        self.removed[indices] = False
+
+        starts = indices[graph_automaton.start_mask[indices]]
+        new_starts = np.array(
+            [start for start in starts if start not in self.block_of], dtype=int
+        )
+        for start in new_starts:
+            self.block_of[int(start)] = len(self.block_of)
+        self.graph_starts = np.concatenate([self.graph_starts, new_starts])
+
+        n_of_new_rows = new_starts.size * self.regex_automaton.number_of_states
+        self.visited = VisitedMask(
+            vstack(
+                [
+                    self.visited.matrix,
+                    csr_matrix(
+                        (n_of_new_rows, graph_automaton.number_of_states), dtype=bool
+                    ),
+                ],
+                format="csr",
+            )
+        )
+
+        return self._start_front([self.block_of[int(start)] for start in starts])
+
+    def add_edges(
+        self, edges: Iterable[tuple[Hashable, Hashable, Hashable]]
+    ) -> set[tuple[Hashable, Hashable]]:
+        edges = list(edges)
+        graph_automaton = self.graph_automaton
+        nodes = list(dict.fromkeys(node for u, _, v in edges for node in (u, v)))
+        new_nodes = [node for node in nodes if node not in graph_automaton.states]
+        if new_nodes:
+            self._add_nodes(new_nodes)
+        front = self._activate(
+            [node for node in nodes if self.removed[graph_automaton.states[node]]]
+        )
+
+        n_of_blocks = self.graph_starts.size
+        for label, delta in self._label_deltas(edges).items():
+            sym_id = graph_automaton.add_symbol(label)
+            graph_automaton.matrices[sym_id] = graph_automaton.matrices[sym_id] + delta
+
+            regex_sym_id = self.regex_automaton.symbol_id(label)
+            if regex_sym_id is not None:
+                front = front + block_diagonal(
+                    self.regex_automaton.matrices[regex_sym_id].T, n_of_blocks
+                ) @ (self.visited.matrix @ delta)
+
+        reached = self._propagate(csr_matrix(front > self.visited.matrix))
+
+        new_pairs = self._pairs(reached) - self.answer
+        self.answer |= new_pairs
+        return new_pairs
+
+    def add_edge(
+        self, u: Hashable, label: Hashable, v: Hashable
+    ) -> set[tuple[Hashable, Hashable]]:
+        return self.add_edges([(u, label, v)])
+
+    def _label_deltas(
+        self, edges: list[tuple[Hashable, Hashable, Hashable]]
+    ) -> dict[Hashable, csr_matrix]:
+        states = self.graph_automaton.states
+        n_of_states = self.graph_automaton.number_of_states
+
+        return {
+            label: sparse_front(
+                [states[u] for u, edge_label, _ in edges if edge_label == label],
+                [states[v] for _, edge_label, v in edges if edge_label == label],
+                (n_of_states, n_of_states),
+            )
+            for label in dict.fromkeys(label for _, label, _ in edges)
+        }
+
+    def _propagate(self, front: csr_matrix) -> csr_matrix:
+        intersection = self._intersection()
+        reached = front
+        while front.nnz > 0:
+            self.visited.add(front)
+            front = intersection.step(front, self.visited)
+            reached = reached + front
+
+        return reached
+
+    def _delete(
+        self,
+        old_graph_automaton: AdjacencyMatrixFA,
+        deltas: dict[Hashable, csr_matrix],
+        affected: csr_matrix,
+    ) -> set[tuple[Hashable, Hashable]]:
+        visited = self.visited.matrix
+        n_of_blocks = self.graph_starts.size
+        for label, delta in deltas.items():
+            regex_sym_id = self.regex_automaton.symbol_id(label)
+            if regex_sym_id is not None:
+                affected = affected + block_diagonal(
+                    self.regex_automaton.matrices[regex_sym_id].T, n_of_blocks
+                ) @ (visited @ delta)
+        affected = csr_matrix(affected.multiply(visited), dtype=bool)
+
+        old_intersection = self._intersection(old_graph_automaton)
+        front = affected
+        while front.nnz > 0:
+            front = csr_matrix(
+                csr_matrix(old_intersection.step(front).multiply(visited), dtype=bool)
+                > affected
+            )
+            affected = affected + front
+
+        old_answer = self.answer
+        if affected.nnz > self.recompute_threshold * visited.nnz:
+            self._recompute()
+        else:
+            remaining = csr_matrix(visited > affected)
+            rederived = (
+                self._intersection().step(remaining)
+                + self._start_front(self._active_blocks())
+            ).multiply(affected)
+
+            self.visited = VisitedMask(remaining)
+            self._propagate(csr_matrix(rederived, dtype=bool))
+            self.answer = self._pairs(self.visited.matrix)
+
+        return old_answer - self.answer
+
+    def remove_edges(
+        self, edges: Iterable[tuple[Hashable, Hashable, Hashable]]
+    ) -> set[tuple[Hashable, Hashable]]:
+        graph_automaton = self.graph_automaton
+        edges = [
+            (u, label, v)
+            for u, label, v in edges
+            if u in graph_automaton.states
+            and v in graph_automaton.states
+            and label in graph_automaton.label_ids
+        ]
+
+        old_graph_automaton = _snapshot(graph_automaton)
+        deltas = dict()
+        for label, delta in self._label_deltas(edges).items():
+            sym_id = graph_automaton.symbol_id(label)
+            adj_matrix = graph_automaton.matrices[sym_id]
+            deltas[label] = csr_matrix(adj_matrix.multiply(delta), dtype=bool)
+            graph_automaton.matrices[sym_id] = csr_matrix(adj_matrix > deltas[label])
+
+        return self._delete(
+            old_graph_automaton, deltas, csr_matrix(self.visited.shape, dtype=bool)
+        )
+
+    def remove_edge(
+        self, u: Hashable, label: Hashable, v: Hashable
+    ) -> set[tuple[Hashable, Hashable]]:
+        return self.remove_edges([(u, label, v)])
+
+    def remove_nodes(self, nodes: Iterable[Hashable]) -> set[tuple[Hashable, Hashable]]:
+        graph_automaton = self.graph_automaton
+        indices = np.array(
+            [
+                graph_automaton.states[node]
+                for node in nodes
+                if node in graph_automaton.states
+                and not self.removed[graph_automaton.states[node]]
+            ],
+            dtype=int,
+        )
+
+        old_graph_automaton = _snapshot(graph_automaton)
+        selected = np.zeros(graph_automaton.number_of_states, dtype=bool)
+        selected[indices] = True
+        selection = diags(selected, dtype=bool, format="csr")
+
+        deltas = dict()
+        for sym_id, (label, adj_matrix) in enumerate(
+            zip(graph_automaton.labels, graph_automaton.matrices)
+        ):
+            deltas[label] = csr_matrix(
+                selection @ adj_matrix + adj_matrix @ selection, dtype=bool
+            )
+            graph_automaton.matrices[sym_id] = csr_matrix(adj_matrix > deltas[label])
+
+        removed_blocks = [
+            self.block_of[int(index)]
+            for index in indices
+            if int(index) in self.block_of
+        ]
+        graph_automaton.start_mask = graph_automaton.start_mask.copy()
+        graph_automaton.final_mask = graph_automaton.final_mask.copy()
+        graph_automaton.start_mask[indices] = False
+        graph_automaton.final_mask[indices] = False
+        self.removed[indices] = True
+
+        n_of_regex_states = self.regex_automaton.number_of_states
+        block_rows = np.zeros(self.visited.shape[0], dtype=bool)
+        for block in removed_blocks:
+            block_rows[block * n_of_regex_states : (block + 1) * n_of_regex_states] = (
+                True
+            )
+
+        return self._delete(
+            old_graph_automaton,
+            deltas,
+            diags(block_rows, dtype=bool, format="csr") @ self.visited.matrix,
+        )
+
+    def remove_node(self, node: Hashable) -> set[tuple[Hashable, Hashable]]:
+        return self.remove_nodes([node])
@@ -1,113 +1,591 @@
 import networkx as nx
+import numpy as np
 
-from itertools import product
-from scipy.sparse import csr_matrix
-from pyformlang.finite_automaton import Symbol
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from scipy.sparse import csr_matrix, diags
+from tempfile import TemporaryDirectory
+from typing import Hashable, Iterator
 
-from project.regular.automatons import AdjacencyMatrixFA, intersect_automata
-from project.regular.to_automaton import regex_to_dfa, graph_to_nfa
+from project.graph_index import GraphIndex, as_graph_automaton, save_by_index
+from project.regular.automatons import (
+    AdjacencyMatrixFA,
+    LazyIntersectionFA,
+    disjoint_union,
+    intersect_automata,
+    names_array,
+)
+from project.regular.fronts import VisitedMask, multi_source_front, sparse_front
+from project.regular.product import ProductIndex
+from project.regular.regex_cache import regex_cache
+from project.regular.witness import RPQWitnesses
+
+FRONT_ENTRY_BYTES = 32
+PILOT_CHUNK_SIZE = 8
+
+
+def _answer_pairs(
+    graph_automaton: AdjacencyMatrixFA,
+    graph_starts: np.ndarray,
+    graph_finals: np.ndarray,
+    as_array: bool = False,
+) -> set[tuple[int, int]] | np.ndarray:
+    graph_state_names = names_array(graph_automaton.state_names)
+    if as_array:
+        return graph_state_names[_unique_pairs(graph_starts, graph_finals)]
+
+    return set(_answer_names(graph_state_names, graph_starts, graph_finals))
+
+
+def _unique_pairs(graph_starts: np.ndarray, graph_finals: np.ndarray) -> np.ndarray:
+    return np.unique(
+        np.column_stack((graph_starts, graph_finals)).reshape(-1, 2), axis=0
+    )
+
+
+def _answer_names(
+    graph_state_names: np.ndarray, graph_starts: np.ndarray, graph_finals: np.ndarray
+) -> Iterator[tuple[int, int]]:
+    return zip(
+        graph_state_names[graph_starts].tolist(),
+        graph_state_names[graph_finals].tolist(),
+    )
+
+
+def count_pairs(
+    graph_automaton: AdjacencyMatrixFA, answer: csr_matrix, per_start: bool = False
+) -> int | dict[Hashable, int]:
+    answer = csr_matrix(
+        diags(graph_automaton.start_mask, dtype=bool, format="csr")
+        @ answer
+        @ diags(graph_automaton.final_mask, dtype=bool, format="csr"),
+        dtype=bool,
+    )
+    answer.eliminate_zeros()
+    counts = np.diff(answer.indptr)
+    if not per_start:
+        return int(counts.sum())
+
+    graph_starts = np.flatnonzero(graph_automaton.start_mask)
+    return dict(
+        zip(
+            [graph_automaton.state_names[start] for start in graph_starts],
+            counts[graph_starts].tolist(),
+        )
+    )
+
+
+def _count_answer(
+    graph_automaton: AdjacencyMatrixFA,
+    graph_starts: np.ndarray,
+    graph_finals: np.ndarray,
+    per_start: bool = False,
+) -> int | dict[Hashable, int]:
+    n_of_states = graph_automaton.number_of_states
+    return count_pairs(
+        graph_automaton,
+        sparse_front(graph_starts, graph_finals, (n_of_states, n_of_states)),
+        per_start,
+    )
+
+
+def _tensor_answer(
+    regex_automaton: AdjacencyMatrixFA,
+    graph_automaton: AdjacencyMatrixFA,
+    intersection: AdjacencyMatrixFA | LazyIntersectionFA,
+    graph_starts: np.ndarray,
+    max_length: int = None,
+    min_length: int = 0,
+    condense: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    product_index = ProductIndex(
+        regex_automaton.number_of_states, graph_automaton.number_of_states
+    )
+    regex_starts = np.flatnonzero(regex_automaton.start_mask)
+    start_graph_idx = np.tile(graph_starts, regex_starts.size)
+    closure = intersection.transitive_сlosure(
+        product_index.encode(
+            np.repeat(regex_starts, graph_starts.size), start_graph_idx
+        ),
+        max_length,
+        min_length,
+        condense,
+    ).tocoo()
+
+    regex_finals, graph_finals = product_index.decode(closure.col)
+    answer = (
+        regex_automaton.final_mask[regex_finals]
+        & graph_automaton.final_mask[graph_finals]
+    )
+
+    return start_graph_idx[closure.row[answer]], graph_finals[answer]
+
+
+def _tensor_based_answer(
+    regex: str,
+    graph_automaton: AdjacencyMatrixFA,
+    lazy: bool = False,
+    max_length: int = None,
+    min_length: int = 0,
+    condense: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    regex_automaton = regex_cache.automaton(regex)
+    intersection = (
+        LazyIntersectionFA(regex_automaton, graph_automaton)
+        if lazy
+        else intersect_automata(regex_automaton, graph_automaton)
+    )
+
+    return _tensor_answer(
+        regex_automaton,
+        graph_automaton,
+        intersection,
+        np.flatnonzero(graph_automaton.start_mask),
+        max_length,
+        min_length,
+        condense,
+    )
 
 
 def tensor_based_rpq(
     regex: str,
-    graph: nx.MultiDiGraph,
+    graph: nx.MultiDiGraph | GraphIndex,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
-) -> set[tuple[int, int]]:
-    regex_automaton = AdjacencyMatrixFA(regex_to_dfa(regex))
-    graph_automaton = AdjacencyMatrixFA(graph_to_nfa(graph, start_nodes, final_nodes))
-    intersection = intersect_automata(regex_automaton, graph_automaton)
-    closure = intersection.transitive_сlosure()
-
-    return set(
-        (graph_start, graph_final)
-        for graph_start, graph_final, regex_start, regex_final in product(
-            graph_automaton.start_states,
-            graph_automaton.final_states,
-            regex_automaton.start_states,
-            regex_automaton.final_states,
-        )
-        if closure[
-            intersection.states[(regex_start, graph_start)],
-            intersection.states[(regex_final, graph_final)],
-        ]
+    lazy: bool = False,
+    as_array: bool = False,
+    max_length: int = None,
+    min_length: int = 0,
+    condense: bool = False,
+) -> set[tuple[int, int]] | np.ndarray:
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    return _answer_pairs(
+        graph_automaton,
+        *_tensor_based_answer(
+            regex, graph_automaton, lazy, max_length, min_length, condense
+        ),
+        as_array,
+    )
+
+
+def count_tensor_based_rpq(
+    regex: str,
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    lazy: bool = False,
+    per_start: bool = False,
+    max_length: int = None,
+    min_length: int = 0,
+    condense: bool = False,
+) -> int | dict[Hashable, int]:
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    return _count_answer(
+        graph_automaton,
+        *_tensor_based_answer(
+            regex, graph_automaton, lazy, max_length, min_length, condense
+        ),
+        per_start,
+    )
+
+
+def iter_tensor_based_rpq(
+    regex: str,
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    lazy: bool = False,
+    batch_size: int = 64,
+    max_length: int = None,
+    min_length: int = 0,
+) -> Iterator[tuple[int, int]]:
+    regex_automaton = regex_cache.automaton(regex)
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    intersection = (
+        LazyIntersectionFA(regex_automaton, graph_automaton)
+        if lazy
+        else intersect_automata(regex_automaton, graph_automaton)
     )
 
+    graph_state_names = names_array(graph_automaton.state_names)
+    graph_starts = np.flatnonzero(graph_automaton.start_mask)
+    for i in range(0, graph_starts.size, batch_size):
+        pairs = _unique_pairs(
+            *_tensor_answer(
+                regex_automaton,
+                graph_automaton,
+                intersection,
+                graph_starts[i : i + batch_size],
+                max_length,
+                min_length,
+            )
+        )
+        yield from _answer_names(graph_state_names, pairs[:, 0], pairs[:, 1])
+
 
 def init_front(
-    regex_automaton: AdjacencyMatrixFA, graph_automaton: AdjacencyMatrixFA
+    regex_automaton: AdjacencyMatrixFA,
+    graph_automaton: AdjacencyMatrixFA,
+    graph_starts: np.ndarray = None,
 ) -> csr_matrix:
-    front = csr_matrix(
-        (
-            regex_automaton.number_of_states * len(graph_automaton.start_states),
-            graph_automaton.number_of_states,
-        )
+    return multi_source_front(
+        regex_automaton.start_mask,
+        np.flatnonzero(graph_automaton.start_mask)
+        if graph_starts is None
+        else graph_starts,
+        graph_automaton.number_of_states,
     )
 
-    graph_start_states = sorted(graph_automaton.start_states)
-    for i, graph_state_name in enumerate(graph_start_states):
-        for regex_state_name in regex_automaton.start_states:
-            regex_idx = (
-                regex_automaton.states[regex_state_name]
-                + i * regex_automaton.number_of_states
-            )
-            graph_idx = graph_automaton.states[graph_state_name]
-            front[regex_idx, graph_idx] = True
 
-    return front
+def _ms_bfs_reached(
+    regex_automaton: AdjacencyMatrixFA,
+    graph_automaton: AdjacencyMatrixFA,
+    graph_starts: np.ndarray,
+    max_length: int = None,
+    min_length: int = 0,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return _visited_answer(
+        regex_automaton,
+        graph_automaton,
+        graph_starts,
+        _ms_bfs_visited(
+            regex_automaton, graph_automaton, graph_starts, max_length, min_length
+        ),
+    )
 
 
-def update_front(
-    front: csr_matrix,
+def _ms_bfs_visited(
     regex_automaton: AdjacencyMatrixFA,
     graph_automaton: AdjacencyMatrixFA,
-    symbols: set[Symbol],
+    graph_starts: np.ndarray,
+    max_length: int = None,
+    min_length: int = 0,
 ) -> csr_matrix:
-    next_front = front
-    regex_n_of_states = regex_automaton.number_of_states
-
-    for sym in symbols:
-        sym_front = front @ graph_automaton.adj_decomposition[sym]
-        for i in range(len(graph_automaton.start_states)):
-            sym_front[i * regex_n_of_states : (i + 1) * regex_n_of_states] = (
-                regex_automaton.adj_decomposition[sym].T
-                @ sym_front[i * regex_n_of_states : (i + 1) * regex_n_of_states]
+    intersection = LazyIntersectionFA(regex_automaton, graph_automaton)
+    return intersection.reachable(
+        init_front(regex_automaton, graph_automaton, graph_starts),
+        max_length,
+        min_length,
+    )
+
+
+def _visited_answer(
+    regex_automaton: AdjacencyMatrixFA,
+    graph_automaton: AdjacencyMatrixFA,
+    graph_starts: np.ndarray,
+    visited: csr_matrix,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rows, graph_finals = visited.nonzero()
+    blocks, regex_finals = np.divmod(rows, regex_automaton.number_of_states)
+    answer = (
+        regex_automaton.final_mask[regex_finals]
+        & graph_automaton.final_mask[graph_finals]
+    )
+
+    return graph_starts[blocks[answer]], graph_finals[answer], regex_finals[answer]
+
+
+def _ms_bfs_answer(
+    regex_automaton: AdjacencyMatrixFA,
+    graph_automaton: AdjacencyMatrixFA,
+    graph_starts: np.ndarray,
+    max_length: int = None,
+    min_length: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    starts, finals, _ = _ms_bfs_reached(
+        regex_automaton, graph_automaton, graph_starts, max_length, min_length
+    )
+    return starts, finals
+
+
+def _chunk_size(
+    pilot_visited: csr_matrix, n_of_pilot_starts: int, memory_budget: int
+) -> int:
+    bytes_per_start = FRONT_ENTRY_BYTES * max(
+        pilot_visited.nnz / max(n_of_pilot_starts, 1), 1
+    )
+    return max(1, int(memory_budget // bytes_per_start))
+
+
+_chunk_worker_graph = None
+
+
+def _init_chunk_worker(graph_path: str):
+    global _chunk_worker_graph
+    _chunk_worker_graph = AdjacencyMatrixFA.load(graph_path)
+    _chunk_worker_graph.final_mask = np.ones(
+        _chunk_worker_graph.number_of_states, dtype=bool
+    )
+
+
+def _ms_bfs_chunk(
+    regex: str, graph_starts: np.ndarray, max_length: int, min_length: int
+):
+    return _ms_bfs_answer(
+        regex_cache.automaton(regex),
+        _chunk_worker_graph,
+        graph_starts,
+        max_length,
+        min_length,
+    )
+
+
+def _iter_ms_bfs_levels(
+    regex_automaton: AdjacencyMatrixFA,
+    graph_automaton: AdjacencyMatrixFA,
+    graph_starts: np.ndarray,
+    max_length: int = None,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    intersection = LazyIntersectionFA(regex_automaton, graph_automaton)
+    front = init_front(regex_automaton, graph_automaton, graph_starts)
+    visited = VisitedMask(front)
+    found = csr_matrix(
+        (graph_starts.size, graph_automaton.number_of_states), dtype=bool
+    )
+
+    levels = 0
+    while front.nnz > 0:
+        rows, graph_finals = front.nonzero()
+        blocks, regex_finals = np.divmod(rows, regex_automaton.number_of_states)
+        answer = (
+            regex_automaton.final_mask[regex_finals]
+            & graph_automaton.final_mask[graph_finals]
+        )
+
+        new_pairs = csr_matrix(
+            sparse_front(blocks[answer], graph_finals[answer], found.shape) > found
+        )
+        found = found + new_pairs
+        blocks, graph_finals = new_pairs.nonzero()
+        yield graph_starts[blocks], graph_finals
+
+        if max_length is not None and levels >= max_length:
+            break
+        front = intersection.step(front, visited)
+        visited.add(front)
+        levels += 1
+
+
+def iter_ms_bfs_based_rpq(
+    regex: str,
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    max_length: int = None,
+) -> Iterator[tuple[int, int]]:
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    graph_state_names = names_array(graph_automaton.state_names)
+
+    for starts, finals in _iter_ms_bfs_levels(
+        regex_cache.automaton(regex),
+        graph_automaton,
+        np.flatnonzero(graph_automaton.start_mask),
+        max_length,
+    ):
+        yield from _answer_names(graph_state_names, starts, finals)
+
+
+def ms_bfs_based_rpq_by_level(
+    regex: str,
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    max_length: int = None,
+) -> list[set[tuple[int, int]]]:
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    graph_state_names = names_array(graph_automaton.state_names)
+
+    levels = [
+        set(_answer_names(graph_state_names, starts, finals))
+        for starts, finals in _iter_ms_bfs_levels(
+            regex_cache.automaton(regex),
+            graph_automaton,
+            np.flatnonzero(graph_automaton.start_mask),
+            max_length,
+        )
+    ]
+    while levels and not levels[-1]:
+        levels.pop()
+
+    return levels
+
+
+def ms_bfs_based_rpq_witnesses(
+    regex: str,
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    max_length: int = None,
+) -> RPQWitnesses:
+    regex_automaton = regex_cache.automaton(regex)
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    graph_starts = np.flatnonzero(graph_automaton.start_mask)
+
+    intersection = LazyIntersectionFA(regex_automaton, graph_automaton)
+    return RPQWitnesses(
+        regex_automaton,
+        graph_automaton,
+        graph_starts,
+        intersection.bfs_levels(
+            init_front(regex_automaton, graph_automaton, graph_starts), max_length
+        ),
+    )
+
+
+def _ms_bfs_based_answer(
+    regex: str,
+    graph_automaton: AdjacencyMatrixFA,
+    memory_budget: int = None,
+    n_jobs: int = 1,
+    max_length: int = None,
+    min_length: int = 0,
+    graph_path: str | Path = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    regex_automaton = regex_cache.automaton(regex)
+    graph_starts = np.flatnonzero(graph_automaton.start_mask)
+
+    if memory_budget is None:
+        return _ms_bfs_answer(
+            regex_automaton, graph_automaton, graph_starts, max_length, min_length
+        )
+
+    pilot_starts = graph_starts[:PILOT_CHUNK_SIZE]
+    pilot_visited = _ms_bfs_visited(
+        regex_automaton, graph_automaton, pilot_starts, max_length, min_length
+    )
+    answers = [
+        _visited_answer(regex_automaton, graph_automaton, pilot_starts, pilot_visited)[
+            :2
+        ]
+    ]
+    chunk_size = _chunk_size(pilot_visited, pilot_starts.size, memory_budget)
+    chunks = [
+        graph_starts[i : i + chunk_size]
+        for i in range(pilot_starts.size, graph_starts.size, chunk_size)
+    ]
+
+    if n_jobs == 1 or len(chunks) <= 1:
+        answers += [
+            _ms_bfs_answer(
+                regex_automaton, graph_automaton, chunk, max_length, min_length
             )
-        next_front += sym_front
+            for chunk in chunks
+        ]
+    else:
+        with ExitStack() as stack:
+            if graph_path is None:
+                graph_path = stack.enter_context(TemporaryDirectory())
+                save_by_index(graph_automaton, graph_path)
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=_init_chunk_worker,
+                initargs=(str(graph_path),),
+            ) as executor:
+                for starts, finals in executor.map(
+                    _ms_bfs_chunk,
+                    [regex] * len(chunks),
+                    chunks,
+                    [max_length] * len(chunks),
+                    [min_length] * len(chunks),
+                ):
+                    is_final = graph_automaton.final_mask[finals]
+                    answers.append((starts[is_final], finals[is_final]))
+
+    return (
+        np.concatenate([starts for starts, _ in answers] + [graph_starts[:0]]),
+        np.concatenate([finals for _, finals in answers] + [graph_starts[:0]]),
+    )
 
-    return next_front
+
+def _shared_graph_path(
+    graph: nx.MultiDiGraph | GraphIndex, memory_budget: int, n_jobs: int
+) -> Path | None:
+    if isinstance(graph, GraphIndex) and memory_budget is not None and n_jobs != 1:
+        return graph.saved_path()
+    return None
 
 
 def ms_bfs_based_rpq(
     regex: str,
-    graph: nx.MultiDiGraph,
+    graph: nx.MultiDiGraph | GraphIndex,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
+    memory_budget: int = None,
+    n_jobs: int = 1,
+    max_length: int = None,
+    min_length: int = 0,
 ) -> set[tuple[int, int]]:
-    regex_automaton = AdjacencyMatrixFA(regex_to_dfa(regex))
-    graph_automaton = AdjacencyMatrixFA(graph_to_nfa(graph, start_nodes, final_nodes))
-
-    symbols = regex_automaton.symbols.intersection(graph_automaton.symbols)
-
-    front = init_front(regex_automaton, graph_automaton)
-    visited = front
-    while front.count_nonzero() > 0:
-        new_front = update_front(front, regex_automaton, graph_automaton, symbols)
-        front = new_front > visited
-        visited += front
-
-    pairs = set()
-    regex_n_of_states = regex_automaton.number_of_states
-    graph_start_states = sorted(graph_automaton.start_states)
-    graph_states_mapping = {v: k for k, v in graph_automaton.states.items()}
-
-    for i, graph_start_name in enumerate(graph_start_states):
-        visited_block = visited[i * regex_n_of_states : (i + 1) * regex_n_of_states]
-        for regex_final_name in regex_automaton.final_states:
-            for reached in visited_block.getrow(
-                regex_automaton.states[regex_final_name]
-            ).indices:
-                if graph_states_mapping[reached] in graph_automaton.final_states:
-                    pairs.add((graph_start_name, graph_states_mapping[reached]))
-
-    return pairs
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    return _answer_pairs(
+        graph_automaton,
+        *_ms_bfs_based_answer(
+            regex,
+            graph_automaton,
+            memory_budget,
+            n_jobs,
+            max_length,
+            min_length,
+            _shared_graph_path(graph, memory_budget, n_jobs),
+        ),
+    )
+
+
+def count_ms_bfs_based_rpq(
+    regex: str,
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    per_start: bool = False,
+    memory_budget: int = None,
+    n_jobs: int = 1,
+    max_length: int = None,
+    min_length: int = 0,
+) -> int | dict[Hashable, int]:
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    return _count_answer(
+        graph_automaton,
+        *_ms_bfs_based_answer(
+            regex,
+            graph_automaton,
+            memory_budget,
+            n_jobs,
+            max_length,
+            min_length,
+            _shared_graph_path(graph, memory_budget, n_jobs),
+        ),
+        per_start,
+    )
+
+
+def batch_ms_bfs_based_rpq(
+    regexes: list[str],
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+) -> dict[tuple[int, int], set[int]]:
+    union_automaton, query_of_state = disjoint_union(
+        [regex_cache.automaton(regex) for regex in regexes]
+    )
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+
+    starts, finals, union_finals = _ms_bfs_reached(
+        union_automaton,
+        graph_automaton,
+        np.flatnonzero(graph_automaton.start_mask),
+    )
+    triples = np.unique(
+        np.column_stack((starts, finals, query_of_state[union_finals])).reshape(-1, 3),
+        axis=0,
+    )
+
+    graph_state_names = names_array(graph_automaton.state_names)
+    answer = dict()
+    for start, final, query in zip(
+        graph_state_names[triples[:, 0]].tolist(),
+        graph_state_names[triples[:, 1]].tolist(),
+        triples[:, 2].tolist(),
+    ):
+        answer.setdefault((start, final), set()).add(query)
+
+    return answer
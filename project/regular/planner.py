@@ -0,0 +1,209 @@
+import networkx as nx
+import numpy as np
+
+from dataclasses import dataclass
+from functools import cache
+from scipy.optimize import nnls
+from time import perf_counter
+
+from project.graph_index import GraphIndex, as_graph_automaton
+from project.regular.automatons import (
+    AdjacencyMatrixFA,
+    intersect_automata,
+    shared_symbols,
+)
+from project.regular.path_query import (
+    _answer_pairs,
+    _ms_bfs_answer,
+    _ms_bfs_based_answer,
+    _tensor_answer,
+    _tensor_based_answer,
+)
+from project.regular.regex_cache import RegexCache, regex_cache
+
+ENGINES = {"tensor": _tensor_based_answer, "ms_bfs": _ms_bfs_based_answer}
+
+CALIBRATION_REGEXES = ["(a | b)* c", "a b* c*"]
+CALIBRATION_GRAPHS = [("random", 150, 3), ("random", 400, 4), ("cycle", 300, 1)]
+CALIBRATION_START_FRACTIONS = [0.02, 0.25, 1.0]
+
+
+@dataclass
+class CostModel:
+    tensor: np.ndarray
+    ms_bfs: np.ndarray
+
+    def estimate(self, features: np.ndarray) -> dict[str, float]:
+        return {
+            "tensor": float(features @ self.tensor),
+            "ms_bfs": float(features @ self.ms_bfs),
+        }
+
+
+def query_features(
+    regex_automaton: AdjacencyMatrixFA, graph_automaton: AdjacencyMatrixFA
+) -> np.ndarray:
+    symbols = shared_symbols(regex_automaton, graph_automaton)
+    regex_edges = sum(regex_automaton.matrices[id1].nnz for _, id1, _ in symbols)
+    graph_edges = sum(graph_automaton.matrices[id2].nnz for _, _, id2 in symbols)
+    kron_edges = sum(
+        regex_automaton.matrices[id1].nnz * graph_automaton.matrices[id2].nnz
+        for _, id1, id2 in symbols
+    )
+    n_of_starts = np.count_nonzero(graph_automaton.start_mask)
+    n_of_finals = np.count_nonzero(graph_automaton.final_mask)
+
+    return np.array(
+        [
+            1.0,
+            regex_automaton.number_of_states * graph_automaton.number_of_states,
+            kron_edges,
+            n_of_starts * regex_edges,
+            n_of_starts * regex_automaton.number_of_states * graph_edges,
+            n_of_starts * n_of_finals,
+        ],
+        dtype=float,
+    )
+
+
+def _calibration_graph(
+    kind: str, n_of_nodes: int, degree: int, seed: int
+) -> nx.MultiDiGraph:
+    rng = np.random.default_rng(seed)
+    n_of_edges = n_of_nodes * degree
+    sources = (
+        np.arange(n_of_edges) % n_of_nodes
+        if kind == "cycle"
+        else rng.integers(n_of_nodes, size=n_of_edges)
+    )
+    targets = (
+        (sources + 1) % n_of_nodes
+        if kind == "cycle"
+        else rng.integers(n_of_nodes, size=n_of_edges)
+    )
+
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(range(n_of_nodes))
+    graph.add_edges_from(
+        (int(u), int(v), {"label": label})
+        for u, v, label in zip(
+            sources, targets, rng.choice(["a", "b", "c"], size=n_of_edges)
+        )
+    )
+
+    return graph
+
+
+def _calibration_tensor(
+    regex_automaton: AdjacencyMatrixFA, graph_automaton: AdjacencyMatrixFA
+):
+    _answer_pairs(
+        graph_automaton,
+        *_tensor_answer(
+            regex_automaton,
+            graph_automaton,
+            intersect_automata(regex_automaton, graph_automaton),
+            np.flatnonzero(graph_automaton.start_mask),
+        ),
+    )
+
+
+def _calibration_ms_bfs(
+    regex_automaton: AdjacencyMatrixFA, graph_automaton: AdjacencyMatrixFA
+):
+    _answer_pairs(
+        graph_automaton,
+        *_ms_bfs_answer(
+            regex_automaton,
+            graph_automaton,
+            np.flatnonzero(graph_automaton.start_mask),
+        ),
+    )
+
+
+CALIBRATION_ENGINES = {"tensor": _calibration_tensor, "ms_bfs": _calibration_ms_bfs}
+
+
+def _measure(engine, *args) -> float:
+    start = perf_counter()
+    engine(*args)
+    return perf_counter() - start
+
+
+@cache
+def calibrate() -> CostModel:
+    calibration_cache = RegexCache()
+    features = []
+    timings = {engine: [] for engine in CALIBRATION_ENGINES}
+
+    for seed, (kind, n_of_nodes, degree) in enumerate(CALIBRATION_GRAPHS):
+        graph = _calibration_graph(kind, n_of_nodes, degree, seed)
+        for regex in CALIBRATION_REGEXES:
+            regex_automaton = calibration_cache.automaton(regex)
+            for start_fraction in CALIBRATION_START_FRACTIONS:
+                start_nodes = set(range(max(1, int(n_of_nodes * start_fraction))))
+                graph_automaton = AdjacencyMatrixFA.from_graph(graph, start_nodes, None)
+                features.append(query_features(regex_automaton, graph_automaton))
+                for engine, query in CALIBRATION_ENGINES.items():
+                    timings[engine].append(
+                        _measure(query, regex_automaton, graph_automaton)
+                    )
+
+    features = np.array(features)
+    scale = np.maximum(features.max(axis=0), 1.0)
+    return CostModel(
+        **{
+            engine: nnls(features / scale, np.array(engine_timings))[0] / scale
+            for engine, engine_timings in timings.items()
+        }
+    )
+
+
+def _estimate_costs(
+    regex: str, graph_automaton: AdjacencyMatrixFA, cost_model: CostModel = None
+) -> dict[str, float]:
+    cost_model = calibrate() if cost_model is None else cost_model
+    return cost_model.estimate(
+        query_features(regex_cache.automaton(regex), graph_automaton)
+    )
+
+
+def estimate_costs(
+    regex: str,
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    cost_model: CostModel = None,
+) -> dict[str, float]:
+    return _estimate_costs(
+        regex, as_graph_automaton(graph, start_nodes, final_nodes), cost_model
+    )
+
+
+def choose_engine(
+    regex: str,
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    cost_model: CostModel = None,
+) -> str:
+    costs = estimate_costs(regex, graph, start_nodes, final_nodes, cost_model)
+    return min(costs, key=costs.get)
+
+
+def rpq(
+    regex: str,
+    graph: nx.MultiDiGraph | GraphIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    engine: str = "auto",
+) -> set[tuple[int, int]]:
+    if engine != "auto" and engine not in ENGINES:
+        raise ValueError(f"Unknown RPQ engine: {engine}")
+
+    graph_automaton = as_graph_automaton(graph, start_nodes, final_nodes)
+    if engine == "auto":
+        costs = _estimate_costs(regex, graph_automaton)
+        engine = min(costs, key=costs.get)
+
+    return _answer_pairs(graph_automaton, *ENGINES[engine](regex, graph_automaton))
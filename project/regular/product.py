@@ -0,0 +1,93 @@
+import numpy as np
+
+from collections.abc import Mapping, Sequence
+from typing import Hashable
+
+
+class ProductIndex:
+    def __init__(
+        self,
+        number_of_states1: int,
+        number_of_states2: int,
+        kept: np.ndarray = None,
+    ):
+        self.number_of_states1 = number_of_states1
+        self.number_of_states2 = number_of_states2
+        self.kept = kept
+
+    @property
+    def number_of_states(self) -> int:
+        if self.kept is not None:
+            return self.kept.size
+        return self.number_of_states1 * self.number_of_states2
+
+    def encode(self, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        product_idx = np.asarray(first, dtype=np.int64) * self.number_of_states2 + (
+            np.asarray(second, dtype=np.int64)
+        )
+        if self.kept is None:
+            return product_idx
+        if self.kept.size == 0:
+            return np.full_like(product_idx, -1)
+
+        positions = np.minimum(
+            np.searchsorted(self.kept, product_idx), self.kept.size - 1
+        )
+        return np.where(self.kept[positions] == product_idx, positions, -1)
+
+    def decode(self, idx: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        idx = np.asarray(idx, dtype=np.int64)
+        if self.kept is not None:
+            idx = self.kept[idx]
+        return np.divmod(idx, self.number_of_states2)
+
+    def combine_masks(self, mask1: np.ndarray, mask2: np.ndarray) -> np.ndarray:
+        if self.kept is None:
+            return np.kron(mask1, mask2)
+
+        first, second = self.decode(np.arange(self.kept.size))
+        return mask1[first] & mask2[second]
+
+
+class ProductStateNames(Sequence):
+    def __init__(self, names1: Sequence, names2: Sequence, product_index: ProductIndex):
+        self.names1 = names1
+        self.names2 = names2
+        self.product_index = product_index
+
+    def __len__(self) -> int:
+        return self.product_index.number_of_states
+
+    def __getitem__(self, idx: int) -> tuple:
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        first, second = self.product_index.decode(idx)
+        return self.names1[first], self.names2[second]
+
+
+class ProductStates(Mapping):
+    def __init__(self, factor1, factor2, product_index: ProductIndex):
+        self.factor1 = factor1
+        self.factor2 = factor2
+        self.product_index = product_index
+
+    def __len__(self) -> int:
+        return self.product_index.number_of_states
+
+    def __iter__(self):
+        return iter(
+            ProductStateNames(
+                self.factor1.state_names, self.factor2.state_names, self.product_index
+            )
+        )
+
+    def __getitem__(self, state_name: tuple[Hashable, Hashable]) -> int:
+        st1, st2 = state_name
+        states1, states2 = self.factor1.states, self.factor2.states
+        if st1 not in states1 or st2 not in states2:
+            raise KeyError(state_name)
+
+        idx = int(self.product_index.encode(states1[st1], states2[st2]))
+        if idx < 0:
+            raise KeyError(state_name)
+        return idx
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from pyformlang.finite_automaton import DeterministicFiniteAutomaton
+
+from project.regular.automatons import AdjacencyMatrixFA
+from project.regular.to_automaton import regex_to_dfa
+
+
+@dataclass
+class CacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+
+
+@dataclass
+class CompiledRegex:
+    dfa: DeterministicFiniteAutomaton
+    automaton: AdjacencyMatrixFA
+
+
+def normalize_regex(regex: str) -> str:
+    return " ".join(regex.split())
+
+
+class RegexCache:
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, regex: str) -> bool:
+        return normalize_regex(regex) in self._entries
+
+    def compile(self, regex: str) -> CompiledRegex:
+        key = normalize_regex(regex)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses += 1
+        dfa = regex_to_dfa(key)
+        compiled = CompiledRegex(dfa, AdjacencyMatrixFA(dfa))
+        if self.maxsize > 0:
+            self._entries[key] = compiled
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return compiled
+
+    def automaton(self, regex: str) -> AdjacencyMatrixFA:
+        return self.compile(regex).automaton
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            self.hits, self.misses, self.evictions, len(self._entries), self.maxsize
+        )
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+regex_cache = RegexCache()
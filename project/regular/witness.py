@@ -0,0 +1,113 @@
+import numpy as np
+
+from scipy.sparse import csc_matrix, csr_matrix
+from typing import Hashable
+
+from project.regular.automatons import AdjacencyMatrixFA, names_array, shared_symbols
+
+
+class RPQWitnesses:
+    def __init__(
+        self,
+        regex_automaton: AdjacencyMatrixFA,
+        graph_automaton: AdjacencyMatrixFA,
+        graph_starts: np.ndarray,
+        levels: list[csr_matrix],
+    ):
+        self.regex_automaton = regex_automaton
+        self.graph_automaton = graph_automaton
+        self.graph_starts = graph_starts
+        self.levels = levels
+        self._block_of_start = {int(start): i for i, start in enumerate(graph_starts)}
+        self._symbols = shared_symbols(regex_automaton, graph_automaton)
+        self._columns = dict()
+
+        n_of_regex_states = regex_automaton.number_of_states
+        graph_state_names = names_array(graph_automaton.state_names)
+        self.pairs = set()
+        for level in levels:
+            rows, graph_finals = level.nonzero()
+            blocks, regex_finals = np.divmod(rows, n_of_regex_states)
+            answer = (
+                regex_automaton.final_mask[regex_finals]
+                & graph_automaton.final_mask[graph_finals]
+            )
+            self.pairs.update(
+                zip(
+                    graph_state_names[graph_starts[blocks[answer]]].tolist(),
+                    graph_state_names[graph_finals[answer]].tolist(),
+                )
+            )
+
+    def _column(self, automaton: AdjacencyMatrixFA, sym_id: int) -> csc_matrix:
+        key = (id(automaton), sym_id)
+        if key not in self._columns:
+            self._columns[key] = csc_matrix(automaton.matrices[sym_id])
+        return self._columns[key]
+
+    def _predecessors(self, matrix: csc_matrix, col: int) -> np.ndarray:
+        return matrix.indices[matrix.indptr[col] : matrix.indptr[col + 1]]
+
+    def distance(self, start: Hashable, final: Hashable) -> int | None:
+        found = self._final_state(start, final)
+        return None if found is None else found[0]
+
+    def _final_state(
+        self, start: Hashable, final: Hashable
+    ) -> tuple[int, int, int] | None:
+        graph_states = self.graph_automaton.states
+        if start not in graph_states or final not in graph_states:
+            return None
+        block = self._block_of_start.get(graph_states[start])
+        graph_final = graph_states[final]
+        if block is None or not self.graph_automaton.final_mask[graph_final]:
+            return None
+
+        n_of_regex_states = self.regex_automaton.number_of_states
+        regex_finals = np.flatnonzero(self.regex_automaton.final_mask)
+        for distance, level in enumerate(self.levels):
+            reached = level[block * n_of_regex_states + regex_finals, graph_final]
+            if reached.nnz > 0:
+                return distance, block, int(regex_finals[reached.nonzero()[0][0]])
+
+        return None
+
+    def path(
+        self, start: Hashable, final: Hashable
+    ) -> list[tuple[Hashable, Hashable, Hashable]] | None:
+        found = self._final_state(start, final)
+        if found is None:
+            return None
+
+        distance, block, regex_state = found
+        graph_state = self.graph_automaton.states[final]
+        graph_state_names = self.graph_automaton.state_names
+        block_offset = block * self.regex_automaton.number_of_states
+
+        path = []
+        for level in reversed(self.levels[:distance]):
+            for label, regex_sym_id, graph_sym_id in self._symbols:
+                regex_preds = self._predecessors(
+                    self._column(self.regex_automaton, regex_sym_id), regex_state
+                )
+                graph_preds = self._predecessors(
+                    self._column(self.graph_automaton, graph_sym_id), graph_state
+                )
+                if regex_preds.size == 0 or graph_preds.size == 0:
+                    continue
+
+                reached = level[block_offset + regex_preds][:, graph_preds].tocoo()
+                if reached.nnz > 0:
+                    regex_state = int(regex_preds[reached.row[0]])
+                    prev_graph_state = int(graph_preds[reached.col[0]])
+                    path.append(
+                        (
+                            graph_state_names[prev_graph_state],
+                            label,
+                            graph_state_names[graph_state],
+                        )
+                    )
+                    graph_state = prev_graph_state
+                    break
+
+        return path[::-1]
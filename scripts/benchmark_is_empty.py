@@ -0,0 +1,58 @@
+import argparse
+import shared
+import sys
+import timeit
+
+import cfpq_data
+
+sys.path.append(str(shared.ROOT))
+
+from project.regular.automatons import AdjacencyMatrixFA, intersect_automata  # noqa: E402
+from project.regular.to_automaton import regex_to_dfa  # noqa: E402
+
+QUERIES = ["a*", "a* b", "(a | b)* b b", "c"]
+
+
+def closure_based_is_empty(automaton: AdjacencyMatrixFA) -> bool:
+    closure = automaton.transitive_сlosure()
+    start_indices = [automaton.states[state] for state in automaton.start_states]
+    final_indices = [automaton.states[state] for state in automaton.final_states]
+
+    return closure[start_indices][:, final_indices].nnz == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare BFS and closure based emptiness checks"
+    )
+    parser.add_argument("--n", type=int, default=300)
+    parser.add_argument("--m", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    graph = cfpq_data.labeled_two_cycles_graph(args.n, args.m, labels=("a", "b"))
+    graph_automaton = AdjacencyMatrixFA.from_graph(graph, {0}, {args.n})
+
+    for regex in QUERIES:
+        intersection = intersect_automata(
+            AdjacencyMatrixFA(regex_to_dfa(regex)), graph_automaton
+        )
+        report = intersection.emptiness_report()
+        assert report.is_empty == closure_based_is_empty(intersection)
+
+        bfs_time = timeit.timeit(intersection.is_empty, number=args.repeat)
+        closure_time = timeit.timeit(
+            lambda: closure_based_is_empty(intersection), number=args.repeat
+        )
+
+        print(
+            f"{regex!r:16} states={intersection.number_of_states:<8} "
+            f"empty={report.is_empty!s:<6} levels={report.levels:<5} "
+            f"visited={report.visited_states:<8} "
+            f"bfs={bfs_time / args.repeat:.4f}s "
+            f"closure={closure_time / args.repeat:.4f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
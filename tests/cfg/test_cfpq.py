@@ -0,0 +1,60 @@
+import cfpq_data
+import pytest
+
+from itertools import islice
+from pyformlang.cfg import CFG
+
+from project.cfg.path_query import (
+    count_matrix_based_cfpq,
+    count_tensor_based_cfpq,
+    iter_hellings_based_cfpq,
+    iter_matrix_based_cfpq,
+    iter_tensor_based_cfpq,
+    matrix_based_cfpq,
+)
+from project.cfg.rsm import cfg_to_rsm
+
+GRAMMARS = [
+    "S -> a S b | $",
+    "S -> a S | b",
+    "S -> S S | a | b",
+]
+
+
+@pytest.mark.parametrize("grammar", GRAMMARS)
+def test_iter_cfpq_matches_set(grammar: str):
+    cfg = CFG.from_text(grammar)
+    graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+    expected = matrix_based_cfpq(cfg, graph)
+
+    for pairs in [
+        list(iter_hellings_based_cfpq(cfg, graph)),
+        list(iter_matrix_based_cfpq(cfg, graph)),
+        list(iter_tensor_based_cfpq(cfg_to_rsm(cfg), graph)),
+    ]:
+        assert len(pairs) == len(set(pairs))
+        assert set(pairs) == expected
+
+
+def test_iter_cfpq_early_termination():
+    cfg = CFG.from_text("S -> S S | a | b")
+    graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+
+    assert len(list(islice(iter_matrix_based_cfpq(cfg, graph), 2))) == 2
+    assert len(list(islice(iter_tensor_based_cfpq(cfg_to_rsm(cfg), graph), 2))) == 2
+
+
+@pytest.mark.parametrize("grammar", GRAMMARS)
+def test_count_cfpq_matches_set_size(grammar: str):
+    cfg = CFG.from_text(grammar)
+    graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+    pairs = matrix_based_cfpq(cfg, graph, {0, 1})
+    per_start = {start: sum(1 for u, _ in pairs if u == start) for start in (0, 1)}
+
+    assert count_matrix_based_cfpq(cfg, graph, {0, 1}) == len(pairs)
+    assert count_tensor_based_cfpq(cfg_to_rsm(cfg), graph, {0, 1}) == len(pairs)
+    assert count_matrix_based_cfpq(cfg, graph, {0, 1}, per_start=True) == per_start
+    assert (
+        count_tensor_based_cfpq(cfg_to_rsm(cfg), graph, {0, 1}, per_start=True)
+        == per_start
+    )
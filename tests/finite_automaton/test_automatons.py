@@ -0,0 +1,217 @@
+import cfpq_data
+import networkx as nx
+import numpy as np
+import pytest
+
+from scipy.sparse import csr_matrix
+from typing import List, Set
+
+from project.regular.automatons import (
+    AdjacencyMatrixFA,
+    LazyIntersectionFA,
+    intersect_automata,
+    intersect_automata_trimmed,
+)
+from project.regular.fronts import masked_matmul, multi_source_front
+from project.regular.product import ProductIndex
+from project.regular.to_automaton import graph_to_nfa, regex_to_dfa
+
+
+@pytest.mark.parametrize(
+    "regex, words",
+    [
+        ("a b* c", [[], ["a"], ["a", "c"], ["a", "b", "b", "c"], ["a", "b", "d"]]),
+        ("(x|y)*", [[], ["x"], ["y", "x", "y"], ["z"], ["x", "z"]]),
+        ("g(o*)l", [["g", "l"], ["g", "o", "l"], ["g", "o"], ["g", "o", "o", "l"]]),
+    ],
+)
+def test_accepts_many_matches_accepts(regex: str, words: List[List[str]]):
+    automaton = AdjacencyMatrixFA(regex_to_dfa(regex))
+
+    assert automaton.accepts_many(words) == [automaton.accepts(word) for word in words]
+
+
+@pytest.mark.parametrize("regex", ["a b* c", "(x|y)* z", "(a b)* | c*"])
+def test_transitive_closure_rows_match_full_closure(regex: str):
+    automaton = AdjacencyMatrixFA(regex_to_dfa(regex))
+    rows = list(range(automaton.number_of_states))
+
+    full_closure = automaton.transitive_сlosure()
+    rows_closure = automaton.transitive_сlosure(rows)
+
+    assert (full_closure != rows_closure).nnz == 0
+
+
+@pytest.mark.parametrize("regex", ["(a | b)* b", "a b* c", "(a b)* | b*"])
+def test_condensed_closure_matches_fixpoint_closure(regex: str):
+    graph = cfpq_data.labeled_two_cycles_graph(4, 3, labels=("a", "b"))
+    intersection = intersect_automata(
+        AdjacencyMatrixFA(regex_to_dfa(regex)), AdjacencyMatrixFA(graph_to_nfa(graph))
+    )
+    rows = list(range(0, intersection.number_of_states, 3))
+
+    assert (
+        intersection.transitive_сlosure()
+        != intersection.transitive_сlosure(condense=True)
+    ).nnz == 0
+    assert (
+        intersection.transitive_сlosure(rows)
+        != intersection.transitive_сlosure(rows, condense=True)
+    ).nnz == 0
+    assert intersection.is_empty() == intersection.is_empty(condense=True)
+
+
+@pytest.mark.parametrize(
+    "regex, expected_levels", [("a b c", 3), ("a*", 0), ("(x y)* z", 1)]
+)
+def test_emptiness_report_stops_at_first_final_state(regex: str, expected_levels: int):
+    report = AdjacencyMatrixFA(regex_to_dfa(regex)).emptiness_report()
+
+    assert not report.is_empty
+    assert report.levels == expected_levels
+
+
+@pytest.mark.parametrize(
+    "regex1, regex2",
+    [("(a|b)* c", "a* b c"), ("a b* c", "a c*"), ("(x y)*", "x y x y | x")],
+)
+def test_lazy_intersection_matches_intersect_automata(regex1: str, regex2: str):
+    automaton1 = AdjacencyMatrixFA(regex_to_dfa(regex1))
+    automaton2 = AdjacencyMatrixFA(regex_to_dfa(regex2))
+    intersection = intersect_automata(automaton1, automaton2)
+    lazy_intersection = LazyIntersectionFA(automaton1, automaton2)
+
+    assert intersection.is_empty() == lazy_intersection.is_empty()
+    assert (
+        intersection.transitive_сlosure() != lazy_intersection.transitive_сlosure()
+    ).nnz == 0
+
+
+@pytest.mark.parametrize(
+    "regex1, regex2, words",
+    [
+        ("(a|b)* c", "a* b c", [["b", "c"], ["a", "b", "c"], ["a", "c"], []]),
+        ("a b* c", "a c*", [["a", "c"], ["a"], ["a", "b", "c"]]),
+        ("(x y)*", "x y x y | x", [[], ["x", "y"], ["x", "y", "x", "y"], ["x"]]),
+    ],
+)
+def test_trimmed_intersection_matches_intersect_automata(
+    regex1: str, regex2: str, words: List[List[str]]
+):
+    automaton1 = AdjacencyMatrixFA(regex_to_dfa(regex1))
+    automaton2 = AdjacencyMatrixFA(regex_to_dfa(regex2))
+    intersection = intersect_automata(automaton1, automaton2)
+    trimmed_intersection = intersect_automata_trimmed(automaton1, automaton2)
+
+    assert trimmed_intersection.number_of_states <= intersection.number_of_states
+    assert trimmed_intersection.is_empty() == intersection.is_empty()
+    assert trimmed_intersection.accepts_many(words) == intersection.accepts_many(words)
+
+
+@pytest.mark.parametrize("kept", [None, np.array([1, 4, 5, 11])])
+def test_product_index_round_trip(kept: np.ndarray):
+    product_index = ProductIndex(3, 4, kept)
+    idx = np.arange(product_index.number_of_states)
+
+    assert np.array_equal(product_index.encode(*product_index.decode(idx)), idx)
+    assert product_index.encode(0, 0) == (0 if kept is None else -1)
+
+
+@pytest.mark.parametrize("start_nodes", [set(), {0, 3}])
+@pytest.mark.parametrize("final_nodes", [set(), {1, 5}])
+@pytest.mark.parametrize(
+    "extra_edges", [[], [(3, "epsilon", 5), (5, "ɛ", 6), (6, "epsilon", 0), (2, "", 4)]]
+)
+def test_from_graph_matches_graph_to_nfa(
+    start_nodes: Set[int], final_nodes: Set[int], extra_edges: List
+):
+    graph = cfpq_data.labeled_two_cycles_graph(4, 3, labels=("a", "b"))
+    for u, label, v in extra_edges:
+        graph.add_edge(u, v, label=label)
+    automaton = AdjacencyMatrixFA.from_graph(graph, start_nodes, final_nodes)
+    nfa_automaton = AdjacencyMatrixFA(graph_to_nfa(graph, start_nodes, final_nodes))
+
+    assert automaton.start_states == nfa_automaton.start_states
+    assert automaton.final_states == nfa_automaton.final_states
+    assert automaton.symbols == nfa_automaton.symbols
+    for sym in automaton.symbols:
+        edges = set(zip(*automaton.adj_decomposition[sym].nonzero()))
+        nfa_edges = set(zip(*nfa_automaton.adj_decomposition[sym].nonzero()))
+        assert {
+            (automaton.state_names[u], automaton.state_names[v]) for u, v in edges
+        } == {
+            (nfa_automaton.state_names[u], nfa_automaton.state_names[v])
+            for u, v in nfa_edges
+        }
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_round_trip(tmp_path, mmap: bool):
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+    automaton = AdjacencyMatrixFA.from_graph(graph, {0, 2}, {3})
+
+    automaton.save(tmp_path / "graph")
+    loaded = AdjacencyMatrixFA.load(tmp_path / "graph", mmap=mmap)
+
+    assert loaded.start_states == automaton.start_states
+    assert loaded.final_states == automaton.final_states
+    assert loaded.labels == automaton.labels
+    assert list(loaded.state_names) == list(automaton.state_names)
+    for adj_matrix, loaded_matrix in zip(automaton.matrices, loaded.matrices):
+        assert (adj_matrix != loaded_matrix).nnz == 0
+    assert loaded.accepts_many([["a"], ["b", "b"]]) == automaton.accepts_many(
+        [["a"], ["b", "b"]]
+    )
+
+
+def test_adj_decomposition_is_read_only():
+    automaton = AdjacencyMatrixFA(regex_to_dfa("a b"))
+
+    with pytest.raises(TypeError):
+        automaton.adj_decomposition["a"] = automaton.matrix("b")
+
+
+def test_save_load_keeps_mixed_names_and_rejects_tuples(tmp_path):
+    graph = nx.MultiDiGraph()
+    graph.add_edge(1, "s", label="a")
+    AdjacencyMatrixFA.from_graph(graph).save(tmp_path / "mixed")
+
+    assert AdjacencyMatrixFA.load(tmp_path / "mixed").states == {1: 0, "s": 1}
+
+    graph.add_edge((0, 1), (1, 2), label="b")
+    with pytest.raises(ValueError):
+        AdjacencyMatrixFA.from_graph(graph).save(tmp_path / "tuples")
+
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label=("x", 1))
+    with pytest.raises(ValueError):
+        AdjacencyMatrixFA.from_graph(graph).save(tmp_path / "tuple_labels")
+    assert not (tmp_path / "tuple_labels").exists()
+
+
+@pytest.mark.parametrize("sources", [[], [2], [0, 3, 3]])
+def test_multi_source_front_blocks(sources: List[int]):
+    block_mask = np.array([True, False, True])
+    front = multi_source_front(block_mask, np.array(sources, dtype=int), 4)
+
+    expected = np.zeros((len(sources) * 3, 4), dtype=bool)
+    for block, source in enumerate(sources):
+        expected[block * 3 : (block + 1) * 3, source] = block_mask
+
+    assert front.dtype == bool
+    assert np.array_equal(front.toarray(), expected)
+
+
+@pytest.mark.parametrize("active_rows", [1, 40, 400])
+def test_masked_matmul_matches_difference(active_rows: int):
+    rng = np.random.default_rng(7)
+    left = csr_matrix(
+        (rng.random((400, 300)) < 0.02) & (np.arange(400) < active_rows)[:, None]
+    )
+    right = csr_matrix(rng.random((300, 500)) < 0.02)
+    mask = csr_matrix(rng.random((400, 500)) < 0.5)
+
+    masked = masked_matmul(left, right, mask)
+
+    assert masked.shape == (400, 500)
+    assert (masked != csr_matrix(left @ right > mask)).nnz == 0
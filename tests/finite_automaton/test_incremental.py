@@ -0,0 +1,73 @@
+import cfpq_data
+import pytest
+
+from typing import List, Set
+
+from project.regular.incremental import IncrementalRPQ
+from project.regular.path_query import ms_bfs_based_rpq
+
+
+@pytest.mark.parametrize(
+    "edges",
+    [
+        [(0, "b", 2)],
+        [(3, "a", 0), (5, "b", 1)],
+        [(4, "c", 7), (7, "b", 8)],
+    ],
+)
+@pytest.mark.parametrize("start_nodes", [set(), {0, 1}])
+def test_incremental_rpq_matches_recomputation(edges: List, start_nodes: Set[int]):
+    graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+    view = IncrementalRPQ("a* b", graph, start_nodes, None)
+    before = view.pairs
+
+    new_pairs = view.add_edges(edges)
+    for u, label, v in edges:
+        graph.add_edge(u, v, label=label)
+
+    expected = ms_bfs_based_rpq("a* b", graph, start_nodes, None)
+    assert view.pairs == expected
+    assert new_pairs == expected - before
+
+
+def test_incremental_rpq_single_edge_reaches_new_node():
+    graph = cfpq_data.labeled_cycle_graph(3, label="a")
+    view = IncrementalRPQ("a* d", graph, {0}, None)
+
+    assert view.pairs == set()
+    assert view.add_edge(2, "d", 5) == {(0, 5)}
+    assert view.add_edge(2, "d", 5) == set()
+
+
+@pytest.mark.parametrize(
+    "edges",
+    [
+        [(0, "a", 1)],
+        [(1, "a", 2), (0, "b", 4)],
+        [(3, "b", 4), (5, "b", 0), (0, "c", 1)],
+    ],
+)
+@pytest.mark.parametrize("recompute_threshold", [0.0, 0.5, 2.0])
+def test_decremental_rpq_matches_recomputation(edges: List, recompute_threshold: float):
+    graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+    view = IncrementalRPQ("a* b", graph, {0, 1}, None, recompute_threshold)
+    before = view.pairs
+
+    removed_pairs = view.remove_edges(edges)
+    for u, label, v in edges:
+        if graph.has_edge(u, v) and graph[u][v][0]["label"] == label:
+            graph.remove_edge(u, v)
+
+    expected = ms_bfs_based_rpq("a* b", graph, {0, 1}, None)
+    assert view.pairs == expected
+    assert removed_pairs == before - expected
+
+
+def test_decremental_rpq_node_removal_and_revival():
+    graph = cfpq_data.labeled_cycle_graph(3, label="a")
+    view = IncrementalRPQ("a a*", graph, None, None)
+
+    all_pairs = {(u, v) for u in range(3) for v in range(3)}
+    assert view.remove_node(1) == all_pairs - {(2, 0)}
+    assert view.pairs == {(2, 0)}
+    assert view.add_edge(0, "a", 1) == {(2, 1), (0, 1)}
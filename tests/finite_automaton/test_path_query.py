@@ -0,0 +1,193 @@
+import cfpq_data
+import networkx as nx
+import pytest
+
+from itertools import islice
+from typing import List, Set
+
+from project.regular.path_query import (
+    batch_ms_bfs_based_rpq,
+    count_ms_bfs_based_rpq,
+    count_tensor_based_rpq,
+    iter_ms_bfs_based_rpq,
+    iter_tensor_based_rpq,
+    ms_bfs_based_rpq,
+    ms_bfs_based_rpq_by_level,
+    ms_bfs_based_rpq_witnesses,
+    tensor_based_rpq,
+)
+
+
+@pytest.mark.parametrize("regex", ["a* b", "(a | b)* b b", "c"])
+@pytest.mark.parametrize("start_nodes", [set(), {0, 4}])
+@pytest.mark.parametrize("final_nodes", [set(), {1, 6}])
+def test_tensor_rpq_array_matches_set(
+    regex: str, start_nodes: Set[int], final_nodes: Set[int]
+):
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+
+    pairs = tensor_based_rpq(regex, graph, start_nodes, final_nodes)
+    pairs_array = tensor_based_rpq(
+        regex, graph, start_nodes, final_nodes, as_array=True
+    )
+
+    assert pairs_array.shape == (len(pairs), 2)
+    assert set(map(tuple, pairs_array.tolist())) == pairs
+    assert pairs == ms_bfs_based_rpq(regex, graph, start_nodes, final_nodes)
+
+
+@pytest.mark.parametrize("memory_budget", [1, 10**4])
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_chunked_ms_bfs_matches_single_shot(memory_budget: int, n_jobs: int):
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+
+    assert ms_bfs_based_rpq(
+        "(a | b)* b", graph, memory_budget=memory_budget, n_jobs=n_jobs
+    ) == ms_bfs_based_rpq("(a | b)* b", graph)
+
+
+@pytest.mark.parametrize("regex", ["a* b", "(a | b)* b b", "c"])
+def test_iter_rpq_matches_set(regex: str):
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+    expected = ms_bfs_based_rpq(regex, graph)
+
+    for pairs in [
+        list(iter_ms_bfs_based_rpq(regex, graph)),
+        list(iter_tensor_based_rpq(regex, graph, batch_size=3)),
+    ]:
+        assert len(pairs) == len(set(pairs))
+        assert set(pairs) == expected
+
+
+def test_iter_rpq_early_termination():
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+    expected = ms_bfs_based_rpq("(a | b)*", graph)
+
+    assert set(islice(iter_ms_bfs_based_rpq("(a | b)*", graph), 3)) <= expected
+    assert len(list(islice(iter_tensor_based_rpq("(a | b)*", graph), 3))) == 3
+
+
+def test_batch_ms_bfs_tags_pairs_with_queries():
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+    regexes = ["a* b", "(a | b)* b b", "c", "a"]
+
+    answer = batch_ms_bfs_based_rpq(regexes, graph, {0, 2}, None)
+
+    for query, regex in enumerate(regexes):
+        assert {pair for pair, queries in answer.items() if query in queries} == (
+            ms_bfs_based_rpq(regex, graph, {0, 2}, None)
+        )
+
+
+@pytest.mark.parametrize(
+    "min_length, max_length, expected",
+    [
+        (0, 0, {0}),
+        (0, 2, {0, 1, 2}),
+        (2, 3, {2, 3}),
+        (5, 6, {1, 2}),
+        (5, None, {0, 1, 2, 3}),
+    ],
+)
+def test_rpq_length_bounds(min_length: int, max_length: int, expected: Set[int]):
+    graph = cfpq_data.labeled_cycle_graph(4, label="a")
+
+    for rpq in [ms_bfs_based_rpq, tensor_based_rpq]:
+        assert rpq(
+            "a*", graph, {0}, None, max_length=max_length, min_length=min_length
+        ) == {(0, final) for final in expected}
+
+
+def test_ms_bfs_by_level_reports_shortest_distances():
+    graph = cfpq_data.labeled_cycle_graph(4, label="a")
+
+    assert ms_bfs_based_rpq_by_level("a a*", graph, {0}, {2, 3}, max_length=5) == [
+        set(),
+        set(),
+        {(0, 2)},
+        {(0, 3)},
+    ]
+
+
+def test_witness_paths_are_shortest_accepted_paths():
+    graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+    witnesses = ms_bfs_based_rpq_witnesses("a* b", graph, {1}, None)
+
+    assert witnesses.pairs == ms_bfs_based_rpq("a* b", graph, {1}, None)
+    for start, final in witnesses.pairs:
+        path = witnesses.path(start, final)
+        assert len(path) == witnesses.distance(start, final)
+        assert path[0][0] == start and path[-1][2] == final
+        assert [label for _, label, _ in path] == ["a"] * (len(path) - 1) + ["b"]
+        for (_, _, v), (u, _, _) in zip(path, path[1:]):
+            assert v == u
+    assert witnesses.path(1, 1) is None
+
+
+@pytest.mark.parametrize("regex", ["a* b", "(a | b)* b b", "c"])
+@pytest.mark.parametrize("start_nodes", [set(), {0, 4}])
+def test_count_rpq_matches_set_size(regex: str, start_nodes: Set[int]):
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+    pairs = ms_bfs_based_rpq(regex, graph, start_nodes, {1, 6})
+    per_start = {
+        start: sum(1 for u, _ in pairs if u == start)
+        for start in (start_nodes or graph.nodes)
+    }
+
+    assert count_tensor_based_rpq(regex, graph, start_nodes, {1, 6}) == len(pairs)
+    assert count_ms_bfs_based_rpq(regex, graph, start_nodes, {1, 6}) == len(pairs)
+    assert (
+        count_tensor_based_rpq(regex, graph, start_nodes, {1, 6}, per_start=True)
+        == per_start
+    )
+    assert (
+        count_ms_bfs_based_rpq(
+            regex, graph, start_nodes, {1, 6}, per_start=True, memory_budget=1
+        )
+        == per_start
+    )
+
+
+@pytest.mark.parametrize("regex", ["a* b", "(a | b)* b b", "c"])
+def test_condensed_tensor_rpq_matches_fixpoint(regex: str):
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+
+    assert tensor_based_rpq(regex, graph, {0, 4}, condense=True) == tensor_based_rpq(
+        regex, graph, {0, 4}
+    )
+    with pytest.raises(ValueError):
+        tensor_based_rpq(regex, graph, lazy=True, condense=True)
+
+
+@pytest.mark.parametrize("regex", ["a*", "a* b", "b"])
+def test_condensed_tensor_rpq_on_dag(regex: str):
+    graph = nx.MultiDiGraph()
+    for node in range(300):
+        graph.add_edge(node, node + 1, label="a")
+        graph.add_edge(node, 301 + node, label="b")
+
+    assert tensor_based_rpq(regex, graph, {0, 150}, condense=True) == tensor_based_rpq(
+        regex, graph, {0, 150}
+    )
+
+
+@pytest.mark.parametrize(
+    "nodes, expected",
+    [([(0, 1), (1, 2), (2, 3)], {((0, 1), (2, 3))}), ([1, "s", 2], {(1, 2)})],
+)
+def test_rpq_keeps_non_integer_node_names(nodes: List, expected: Set):
+    graph = nx.MultiDiGraph()
+    graph.add_edge(nodes[0], nodes[1], label="a")
+    graph.add_edge(nodes[1], nodes[2], label="b")
+
+    assert tensor_based_rpq("a b", graph) == expected
+    assert ms_bfs_based_rpq("a b", graph) == expected
+    assert set(iter_ms_bfs_based_rpq("a b", graph)) == expected
+    assert batch_ms_bfs_based_rpq(["a b"], graph) == {pair: {0} for pair in expected}
+
+    witnesses = ms_bfs_based_rpq_witnesses("a b", graph)
+    assert witnesses.pairs == expected
+    assert witnesses.path(*next(iter(expected))) == [
+        (nodes[0], "a", nodes[1]),
+        (nodes[1], "b", nodes[2]),
+    ]
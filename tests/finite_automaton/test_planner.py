@@ -0,0 +1,59 @@
+import cfpq_data
+import numpy as np
+import pytest
+
+from project.regular.automatons import AdjacencyMatrixFA
+from project.regular.path_query import ms_bfs_based_rpq
+from project.regular.planner import CostModel, calibrate, choose_engine, rpq
+from project.regular.regex_cache import regex_cache
+
+
+@pytest.mark.parametrize("engine", ["auto", "tensor", "ms_bfs"])
+def test_rpq_engines_agree(engine: str):
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+
+    assert rpq("(a | b)* b", graph, {0, 3}, None, engine) == ms_bfs_based_rpq(
+        "(a | b)* b", graph, {0, 3}, None
+    )
+
+
+def test_auto_rpq_builds_graph_automaton_once(monkeypatch):
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+    expected = ms_bfs_based_rpq("(a | b)* b", graph, {0, 3})
+    calibrate()
+    from_graph = AdjacencyMatrixFA.from_graph
+    calls = []
+
+    def counting_from_graph(*args):
+        calls.append(args)
+        return from_graph(*args)
+
+    monkeypatch.setattr(AdjacencyMatrixFA, "from_graph", counting_from_graph)
+
+    assert rpq("(a | b)* b", graph, {0, 3}) == expected
+    assert len(calls) == 1
+
+
+def test_rpq_rejects_unknown_engine():
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+
+    with pytest.raises(ValueError):
+        rpq("a", graph, engine="hellings")
+
+
+@pytest.mark.parametrize("cheaper", ["tensor", "ms_bfs"])
+def test_choose_engine_follows_cost_model(cheaper: str):
+    graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+    costs = {"tensor": np.full(6, 2.0), "ms_bfs": np.full(6, 2.0)}
+    costs[cheaper] = np.ones(6)
+
+    assert choose_engine("a* b", graph, cost_model=CostModel(**costs)) == cheaper
+
+
+def test_calibration_does_not_touch_shared_regex_cache():
+    calibrate.cache_clear()
+    stats = regex_cache.stats()
+    cost_model = calibrate()
+
+    assert regex_cache.stats() == stats
+    assert (cost_model.tensor >= 0).all() and (cost_model.ms_bfs >= 0).all()
@@ -0,0 +1,29 @@
+from project.regular.regex_cache import RegexCache, normalize_regex
+
+
+def test_normalize_regex_collapses_whitespace():
+    assert normalize_regex("  a   b*\t| c \n") == "a b* | c"
+
+
+def test_regex_cache_counts_hits_and_misses():
+    cache = RegexCache(maxsize=4)
+
+    first = cache.automaton("a b*")
+    second = cache.automaton(" a  b* ")
+
+    assert first is second
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.evictions, stats.size) == (1, 1, 0, 1)
+
+
+def test_regex_cache_evicts_least_recently_used():
+    cache = RegexCache(maxsize=2)
+
+    cache.compile("a")
+    cache.compile("b")
+    cache.compile("a")
+    cache.compile("c")
+
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.stats().evictions == 1
+    assert cache.compile("a").dfa.accepts(["a"])
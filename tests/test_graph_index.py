@@ -0,0 +1,83 @@
+import cfpq_data
+import networkx as nx
+import pytest
+
+from pyformlang.cfg import CFG
+
+from project.cfg.path_query import (
+    hellings_based_cfpq,
+    matrix_based_cfpq,
+    tensor_based_cfpq,
+)
+from project.cfg.rsm import cfg_to_rsm
+from project.graph_index import GraphIndex
+from project.regular.path_query import ms_bfs_based_rpq, tensor_based_rpq
+
+
+@pytest.fixture
+def graph():
+    return cfpq_data.labeled_two_cycles_graph(4, 3, labels=("a", "b"))
+
+
+def test_graph_index_label_stats(graph):
+    index = GraphIndex(graph)
+
+    assert index.number_of_nodes == graph.number_of_nodes()
+    assert set(index.labels) == {"a", "b"}
+    for label, stats in index.label_stats.items():
+        edges = [
+            (u, v)
+            for u, v, edge_label in graph.edges(data="label")
+            if edge_label == label
+        ]
+        assert stats.edges == len(edges)
+        assert stats.sources == len({u for u, _ in edges})
+        assert stats.targets == len({v for _, v in edges})
+
+
+@pytest.mark.parametrize("start_nodes, final_nodes", [(None, None), ({0, 2}, {1, 5})])
+def test_rpq_accepts_graph_index(graph, start_nodes, final_nodes):
+    index = GraphIndex(graph)
+
+    for rpq in [tensor_based_rpq, ms_bfs_based_rpq]:
+        assert rpq("(a | b)* b", index, start_nodes, final_nodes) == rpq(
+            "(a | b)* b", graph, start_nodes, final_nodes
+        )
+
+
+def test_parallel_rpq_shares_saved_graph_index(graph):
+    index = GraphIndex(graph)
+
+    saved = []
+    for final_nodes in [None, {1, 5}]:
+        assert ms_bfs_based_rpq(
+            "(a | b)* b", index, None, final_nodes, memory_budget=1, n_jobs=2
+        ) == ms_bfs_based_rpq("(a | b)* b", graph, None, final_nodes)
+        saved.append((index.saved_path() / "meta.json").stat().st_mtime_ns)
+    assert saved[0] == saved[1]
+
+
+@pytest.mark.parametrize("start_nodes, final_nodes", [(None, None), ({0, 2}, {1, 5})])
+def test_cfpq_accepts_graph_index(graph, start_nodes, final_nodes):
+    index = GraphIndex(graph)
+    cfg = CFG.from_text("S -> a S b | a b")
+
+    expected = matrix_based_cfpq(cfg, graph, start_nodes, final_nodes)
+    for _ in range(2):
+        assert (
+            tensor_based_cfpq(cfg_to_rsm(cfg), index, start_nodes, final_nodes)
+            == expected
+        )
+    assert hellings_based_cfpq(cfg, index, start_nodes, final_nodes) == expected
+    assert matrix_based_cfpq(cfg, index, start_nodes, final_nodes) == expected
+    assert set(index.labels) == {"a", "b"}
+
+
+def test_rpq_skips_epsilon_edges():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="epsilon")
+    graph.add_edge(2, 3, label="b")
+
+    assert tensor_based_rpq("a b", graph, {0}, {3}) == {(0, 3)}
+    assert ms_bfs_based_rpq("a b", GraphIndex(graph), {0}, {3}) == {(0, 3)}